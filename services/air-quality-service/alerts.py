@@ -0,0 +1,196 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "300"))  # seconds before a resolved sensor may alert again
+ALERT_CLEAR_RATIO = float(os.getenv("ALERT_CLEAR_RATIO", "0.8"))  # resolve below threshold * ratio
+ALERT_HIGH_PM25 = 50.0
+
+THRESHOLD_ALERT = "air_quality_alert"
+ANOMALY_ALERT = "anomaly"
+
+class Alert:
+    """One open (or just resolved) alert and the columns of its air_quality_alerts row.
+
+    `id` is the row id once the insert has returned it; `details` are extra
+    fields for broker messages, such as an anomaly's metric and z-score.
+    """
+
+    __slots__ = ("key", "sensor_id", "location", "alert_type", "severity", "value", "peak", "opened_at",
+                 "changed_at", "resolved_at", "message", "details", "id")
+
+    def __init__(self, key: Tuple[str, str], sensor_id: str, location: str, alert_type: str, severity: str,
+                 value: float, opened_at: float, message: str, details: Optional[Dict[str, Any]] = None,
+                 alert_id: Optional[int] = None):
+        self.key = key
+        self.sensor_id = sensor_id
+        self.location = location
+        self.alert_type = alert_type
+        self.severity = severity
+        self.value = value
+        self.peak = value
+        self.opened_at = opened_at
+        self.changed_at = opened_at
+        self.resolved_at: Optional[float] = None
+        self.message = message
+        self.details = details or {}
+        self.id = alert_id
+
+    @property
+    def resolved(self) -> bool:
+        return self.resolved_at is not None
+
+    def row(self) -> Dict[str, Any]:
+        """Column values for inserting the alert"""
+        return {
+            "sensor_id": self.sensor_id,
+            "location": self.location,
+            "alert_type": self.alert_type,
+            "message": self.message,
+            "severity": self.severity,
+            "pm25_value": self.peak,
+            "timestamp": datetime.fromtimestamp(self.opened_at),
+            "resolved": self.resolved,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "sensor_id": self.sensor_id,
+            "location": self.location,
+            "alert_type": self.alert_type,
+            "severity": self.severity,
+            "pm25_value": self.value,
+            "peak": self.peak,
+            "opened_at": datetime.fromtimestamp(self.opened_at).isoformat(),
+            "resolved_at": datetime.fromtimestamp(self.resolved_at).isoformat() if self.resolved else None,
+            "message": self.message,
+            **self.details,
+        }
+
+class AlertEngine:
+    """Per-sensor alert state, so alerts follow state changes rather than readings.
+
+    A PM2.5 alert opens when a reading goes above `threshold`, escalates to
+    high severity once above ALERT_HIGH_PM25 and resolves only when PM2.5
+    drops below `threshold * clear_ratio` (hysteresis). After resolving, the
+    sensor cannot alert again for `cooldown` seconds of reading time. Anomaly
+    alerts follow the rolling statistics, which apply their own hysteresis.
+
+    Changes are queued and taken once per tick by `drain`, coalesced per
+    alert: an escalation in the tick the alert opened is folded into the
+    opening, and a resolution replaces an escalation.
+    """
+
+    def __init__(self, threshold: float, clear_ratio: float = ALERT_CLEAR_RATIO, cooldown: float = ALERT_COOLDOWN):
+        self.threshold = threshold
+        self.clear_level = threshold * clear_ratio
+        self.cooldown = cooldown
+        self.open_alerts: Dict[Tuple[str, str], Alert] = {}
+        self._cooldown_until: Dict[str, float] = {}
+        self._pending: Dict[Alert, List[str]] = {}
+        self._open_thresholds = 0
+
+        self._changes = {"opened": 0, "escalated": 0, "resolved": 0}
+        self._suppressed = 0
+
+    def _queue(self, change: str, alert: Alert, announce: bool):
+        self._changes[change] += 1
+        if not announce:
+            return
+        changes = self._pending.setdefault(alert, [])
+        if change == "escalated" and "opened" in changes:
+            return
+        if change == "resolved" and "escalated" in changes:
+            changes.remove("escalated")
+        changes.append(change)
+
+    def open(self, key: Tuple[str, str], sensor: Dict[str, Any], alert_type: str, severity: str, value: float,
+             at: float, message: str, details: Optional[Dict[str, Any]] = None, announce: bool = True) -> Alert:
+        alert = Alert(key, sensor["id"], sensor["location"], alert_type, severity, value, at, message, details)
+        self.open_alerts[key] = alert
+        if alert_type == THRESHOLD_ALERT:
+            self._open_thresholds += 1
+        self._queue("opened", alert, announce)
+        return alert
+
+    def resolve(self, key: Tuple[str, str], at: float, announce: bool = True) -> Optional[Alert]:
+        alert = self.open_alerts.pop(key, None)
+        if alert is None:
+            return None
+        alert.resolved_at = at
+        alert.changed_at = at
+        if alert.alert_type == THRESHOLD_ALERT:
+            self._open_thresholds -= 1
+            self._cooldown_until[alert.sensor_id] = at + self.cooldown
+        self._queue("resolved", alert, announce)
+        return alert
+
+    def check_pm25(self, sensors: Sequence[Dict[str, Any]], pm25: np.ndarray, times: np.ndarray,
+                   announce: bool = True):
+        """Apply PM2.5 readings (in time order per sensor) to the threshold alerts"""
+        above = pm25 > self.threshold
+        if self._open_thresholds:
+            candidates = np.flatnonzero(above | (pm25 < self.clear_level))
+        else:
+            candidates = np.flatnonzero(above)
+        for i in candidates.tolist():
+            sensor = sensors[i]
+            key = (sensor["id"], THRESHOLD_ALERT)
+            value, at = float(pm25[i]), float(times[i])
+            alert = self.open_alerts.get(key)
+            if alert is None:
+                if not above[i]:
+                    continue
+                if at < self._cooldown_until.get(sensor["id"], 0.0):
+                    self._suppressed += 1
+                    continue
+                severity = "high" if value > ALERT_HIGH_PM25 else "moderate"
+                self.open(key, sensor, THRESHOLD_ALERT, severity, value, at,
+                          f"Air quality alert: PM2.5 level {value} μg/m³ detected at {sensor['location']}",
+                          announce=announce)
+            elif above[i]:
+                alert.value = value
+                alert.peak = max(alert.peak, value)
+                if alert.severity != "high" and value > ALERT_HIGH_PM25:
+                    alert.severity = "high"
+                    alert.changed_at = at
+                    self._queue("escalated", alert, announce)
+            else:
+                alert.value = value
+                self.resolve(key, at, announce)
+
+    def restore(self, rows: List[Dict[str, Any]]):
+        """Reopen unresolved PM2.5 alerts loaded from PostgreSQL after a restart"""
+        for row in rows:
+            key = (row["sensor_id"], THRESHOLD_ALERT)
+            if key in self.open_alerts:
+                continue
+            alert = Alert(key, row["sensor_id"], row["location"], THRESHOLD_ALERT, row["severity"], row["pm25_value"],
+                          row["timestamp"].timestamp(), row["message"], alert_id=row["id"])
+            self.open_alerts[key] = alert
+            self._open_thresholds += 1
+
+    def drain(self) -> List[Tuple[Alert, List[str]]]:
+        """Take the changes queued since the last tick"""
+        pending, self._pending = self._pending, {}
+        return list(pending.items())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": len(self.open_alerts),
+            "open_by_type": {
+                THRESHOLD_ALERT: self._open_thresholds,
+                ANOMALY_ALERT: len(self.open_alerts) - self._open_thresholds,
+            },
+            "threshold": self.threshold,
+            "clear_level": self.clear_level,
+            "cooldown_seconds": self.cooldown,
+            "opened": self._changes["opened"],
+            "escalated": self._changes["escalated"],
+            "resolved": self._changes["resolved"],
+            "suppressed_by_cooldown": self._suppressed,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,76 @@
+from typing import Any, Dict, Mapping, Sequence, Tuple
+
+import numpy as np
+
+POLLUTANTS = ("pm25", "pm10", "o3", "no2", "co", "so2")
+
+# Concentration breakpoints in the units of the US EPA tables (µg/m³ for
+# particulates, ppb for O3/NO2/SO2, ppm for CO) and the AQI at each breakpoint.
+# PM2.5 keeps the breakpoints the service has always used.
+BREAKPOINTS = {
+    "pm25": ([0.0, 12.0, 35.4, 55.4, 150.4, 250.4, 500.4], [0, 50, 100, 150, 200, 300, 500]),
+    "pm10": ([0.0, 54.0, 154.0, 254.0, 354.0, 424.0, 504.0, 604.0], [0, 50, 100, 150, 200, 300, 400, 500]),
+    "o3": ([0.0, 54.0, 70.0, 85.0, 105.0, 200.0, 504.0, 604.0], [0, 50, 100, 150, 200, 300, 400, 500]),
+    "no2": ([0.0, 53.0, 100.0, 360.0, 649.0, 1249.0, 1649.0, 2049.0], [0, 50, 100, 150, 200, 300, 400, 500]),
+    "co": ([0.0, 4.4, 9.4, 12.4, 15.4, 30.4, 40.4, 50.4], [0, 50, 100, 150, 200, 300, 400, 500]),
+    "so2": ([0.0, 35.0, 75.0, 185.0, 304.0, 604.0, 804.0, 1004.0], [0, 50, 100, 150, 200, 300, 400, 500]),
+}
+
+# Sensors report gases in µg/m³ (CO in mg/m³); convert to ppb/ppm at 25 °C.
+UNIT_FACTORS = {"pm25": 1.0, "pm10": 1.0, "o3": 0.509, "no2": 0.532, "co": 0.873, "so2": 0.382}
+
+CATEGORY_LIMITS = np.array([50, 100, 150, 200, 300])
+CATEGORIES = (
+    {"index": 1, "category": "Good", "color": "#00E400"},
+    {"index": 2, "category": "Moderate", "color": "#FFFF00"},
+    {"index": 3, "category": "Unhealthy for Sensitive Groups", "color": "#FF8C00"},
+    {"index": 4, "category": "Unhealthy", "color": "#FF0000"},
+    {"index": 5, "category": "Very Unhealthy", "color": "#8F3F97"},
+    {"index": 6, "category": "Hazardous", "color": "#7E0023"},
+)
+
+_TABLES = {
+    name: (np.asarray(conc, dtype=np.float64), np.asarray(index, dtype=np.float64))
+    for name, (conc, index) in BREAKPOINTS.items()
+}
+
+def sub_index(pollutant: str, values: np.ndarray) -> np.ndarray:
+    """AQI sub-index for one pollutant over an array of readings; NaN stays NaN"""
+    conc, index = _TABLES[pollutant]
+    c = np.asarray(values, dtype=np.float64) * UNIT_FACTORS[pollutant]
+    # Segment i spans conc[i]..conc[i+1]; readings above the table extrapolate
+    # along the last segment, as the original scalar calculation did.
+    seg = np.clip(np.searchsorted(conc, c, side="left") - 1, 0, len(conc) - 2)
+    c_lo, c_hi = conc[seg], conc[seg + 1]
+    i_lo, i_hi = index[seg], index[seg + 1]
+    return i_lo + (i_hi - i_lo) * (c - c_lo) / (c_hi - c_lo)
+
+def sub_indices(readings: Mapping[str, Any], pollutants: Sequence[str] = POLLUTANTS) -> np.ndarray:
+    """Stack sub-indices into a (len(pollutants), N) array"""
+    return np.vstack([
+        sub_index(p, readings[p]) if p in readings else np.full(len(next(iter(readings.values()))), np.nan)
+        for p in pollutants
+    ])
+
+def compute_aqi(readings: Mapping[str, Any], pollutants: Sequence[str] = POLLUTANTS) -> Tuple[np.ndarray, np.ndarray]:
+    """Overall AQI and dominant pollutant index for N readings at once.
+
+    `readings` maps pollutant name to a length-N array. Returns an int array of
+    AQI values (-1 where no pollutant was reported) and the index into
+    `pollutants` of the pollutant that set it.
+    """
+    sub = sub_indices(readings, pollutants)
+    missing = np.isnan(sub).all(axis=0)
+    filled = np.where(np.isnan(sub), -np.inf, sub)
+    dominant = filled.argmax(axis=0)
+    aqi = np.floor(filled[dominant, np.arange(sub.shape[1])])
+    aqi = np.where(missing, -1, aqi).astype(np.int64)
+    return aqi, dominant
+
+def category_indices(aqi: np.ndarray) -> np.ndarray:
+    """1-based category index (see CATEGORIES) for each AQI value"""
+    return np.searchsorted(CATEGORY_LIMITS, np.asarray(aqi), side="left") + 1
+
+def air_quality_index(aqi: float) -> Dict[str, Any]:
+    """Category, index and colour for a single AQI value"""
+    return dict(CATEGORIES[int(category_indices(np.array([aqi]))[0]) - 1])
@@ -0,0 +1,98 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import redis.asyncio as aioredis
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import (
+    ALERT_INSERT, ALERT_UPDATE_BY_ID, ALERT_UPDATE_BY_KEY, DATABASE_URL, MONGODB_URL, REDIS_URL,
+    alert_from_event, format_rollups, latest_cache, latest_query, readings_query, rollup_query,
+    split_alert_updates
+)
+from metrics import timed
+
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "10"))
+PG_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "10"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "5"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
+def to_async_url(url: str) -> str:
+    """Map a sync SQLAlchemy URL onto its asyncio driver"""
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+_pool_options = {} if ASYNC_DATABASE_URL.startswith("sqlite") else {
+    "pool_size": PG_POOL_SIZE,
+    "max_overflow": PG_MAX_OVERFLOW,
+    "pool_timeout": PG_POOL_TIMEOUT,
+    "pool_pre_ping": True,
+}
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+motor_client = AsyncIOMotorClient(MONGODB_URL, maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE)
+async_mongo_db = motor_client.smartcity
+
+async_redis = aioredis.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+
+@timed("save_alert")
+async def save_air_quality_alert_async(alert_data: dict) -> int:
+    """Save air quality alert to PostgreSQL"""
+    async with AsyncSessionLocal() as session:
+        alert = alert_from_event(alert_data)
+        session.add(alert)
+        await session.commit()
+        return alert.id
+
+@timed("save_alerts")
+async def save_alert_changes_async(inserts: List[dict], updates: List[dict]) -> List[int]:
+    """Insert new alerts and update changed ones in one transaction; returns the new ids in order"""
+    by_id, by_key = split_alert_updates(updates)
+    async with AsyncSessionLocal() as session:
+        ids = list((await session.execute(ALERT_INSERT, inserts)).scalars()) if inserts else []
+        if by_id:
+            await session.execute(ALERT_UPDATE_BY_ID, by_id)
+        if by_key:
+            await session.execute(ALERT_UPDATE_BY_KEY, by_key)
+        await session.commit()
+        return ids
+
+async def get_latest_air_quality_data_async(sensor_ids: List[str]) -> List[dict]:
+    """Get latest readings from the cache, falling back to MongoDB for misses"""
+    found = await latest_cache.aget_many(async_redis, sensor_ids)
+    missing = [s for s in sensor_ids if s not in found]
+    if missing:
+        async for document in async_mongo_db.latest_readings.find(latest_query(missing), {"_id": 0}):
+            found[document["sensor_id"]] = document
+            latest_cache.put(document["sensor_id"], document)
+    return [found[s] for s in sensor_ids if s in found]
+
+async def get_air_quality_rollups_async(resolution: str, since: datetime, sensor_ids: List[str],
+                                        until: Optional[datetime] = None) -> Dict[str, List[dict]]:
+    """Get min/max/avg/count per pollutant per bucket (starting before `until`), grouped by sensor"""
+    cursor = async_mongo_db[f"air_quality_rollup_{resolution}"].find(
+        rollup_query(resolution, since, sensor_ids, until), {"_id": 0}
+    ).sort("bucket", ASCENDING)
+    return format_rollups(await cursor.to_list(length=None), sensor_ids)
+
+async def get_air_quality_history_async(sensor_ids: List[str], start: datetime, end: datetime) -> List[dict]:
+    """Raw readings with start <= timestamp < end (naive UTC), oldest first"""
+    cursor = async_mongo_db.air_quality_data.find(
+        readings_query(sensor_ids, start, end), {"_id": 0, "sensor_id": 1, "timestamp": 1, "data": 1}
+    ).sort("timestamp", ASCENDING)
+    return await cursor.to_list(length=None)
+
+async def close_async_database():
+    motor_client.close()
+    await async_redis.close()
+    await async_engine.dispose()
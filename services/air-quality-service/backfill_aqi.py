@@ -0,0 +1,24 @@
+"""Recompute AQI and dominant pollutant for stored air quality readings.
+
+Usage: python backfill_aqi.py [--since 2024-01-01] [--batch-size 10000]
+"""
+import argparse
+import time
+from datetime import datetime
+
+from database import backfill_aqi
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                        help="only backfill readings at or after this UTC timestamp")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    updated = backfill_aqi(since=args.since, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+    print(f"Updated {updated} readings in {elapsed:.2f}s ({updated / max(elapsed, 1e-9):.0f}/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Allocation and serialization cost of the ingestion tick and bulk read endpoints.
+
+Runs the app in-process against the local stand-ins (see standins.py) and
+reports, for one simulated sensor count:
+
+  tick        wall time, traced peak and retained bytes, and the net number of
+              live memory blocks per ingestion tick (tracemalloc); measured
+              again with the heatmap stubbed out, since its FFT buffers
+              dominate the peak and hide the per-reading allocations
+  endpoints   latency and response size of /data/historical (all sensors and
+              one sensor) and /sensors/{id}/data, end to end through the ASGI app
+  encode      the cost of encoding the same /data/historical payload with
+              FastAPI's jsonable_encoder + json.dumps versus orjson directly
+
+Usage: python benchmarks/bench_alloc.py [--sensors 1000] [--ticks 20] [--history-depth 120]
+           [--requests 20] [--output results.json]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+
+def measure_ticks(main, ticks: int) -> dict:
+    main.run_ingestion_tick()  # warm-up: first-touch allocations and geometry caches
+    gc.collect()
+
+    seconds, peaks, retained, blocks = [], [], [], []
+    tracemalloc.start()
+    for _ in range(ticks):
+        gc.collect()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        blocks_before = sys.getallocatedblocks()
+        started = time.perf_counter()
+        main.run_ingestion_tick()
+        seconds.append(time.perf_counter() - started)
+        after, peak = tracemalloc.get_traced_memory()
+        blocks.append(sys.getallocatedblocks() - blocks_before)
+        peaks.append(peak - before)
+        retained.append(after - before)
+    tracemalloc.stop()
+
+    sensors = len(main.sensor_registry)
+    return {
+        "sensors": sensors,
+        "ticks": ticks,
+        "tick_ms": round(float(np.median(seconds)) * 1000, 3),
+        "peak_bytes": int(np.median(peaks)),
+        "peak_bytes_per_reading": round(float(np.median(peaks)) / sensors, 1),
+        "retained_bytes": int(np.median(retained)),
+        "net_blocks": int(np.median(blocks)),
+    }
+
+async def measure_endpoints(main, requests: int) -> dict:
+    import httpx
+
+    sensor_id = main.sensor_registry.ids()[0]
+    cases = {
+        "historical_all": "/data/historical?hours=24",
+        "historical_sensor": f"/data/historical?hours=24&sensor_id={sensor_id}",
+        "sensor_data": f"/sensors/{sensor_id}/data?limit=1000",
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, path in cases.items():
+            latencies = []
+            size = 0
+            for _ in range(requests):
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+                size = len(response.content)
+            values = np.asarray(latencies) * 1000
+            results[name] = {
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "bytes": size,
+            }
+    return results
+
+def measure_encode(main, repeats: int) -> dict:
+    """Encode the all-sensors /data/historical payload both ways"""
+    from fastapi.encoders import jsonable_encoder
+    import orjson
+
+    payload = {sensor["id"]: main.sensor_records(sensor) for sensor in main.sensor_registry.all()}
+
+    def best(fn):
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        return round(min(times) * 1000, 3)
+
+    default_ms = best(lambda: json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                                         separators=(",", ":")).encode())
+    orjson_ms = best(lambda: orjson.dumps(payload))
+    return {
+        "points": sum(len(records) for records in payload.values()),
+        "jsonable_encoder_json_ms": default_ms,
+        "orjson_ms": orjson_ms,
+        "speedup": round(default_ms / orjson_ms, 1) if orjson_ms else None,
+    }
+
+async def run(args) -> dict:
+    import standins
+
+    used = standins.install(args.workdir, env={"HISTORY_DEPTH": str(args.history_depth),
+                                               "LATEST_L1_SIZE": str(max(10000, args.sensors))})
+    standins.seed_sensors(args.sensors)
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    import database
+    import main
+
+    startup = getattr(main, "startup", None)
+    if startup is not None and not await startup.run():
+        raise RuntimeError(f"Startup failed: {startup.status()}")
+    database.ingest_buffer.flush_fn = lambda batch: None  # measure the service, not mongomock
+
+    # Fill history so /data/historical has history_depth points per sensor
+    for _ in range(args.history_depth):
+        main.run_ingestion_tick()
+
+    result = {"stand_ins": used}
+    result["tick"] = measure_ticks(main, args.ticks)
+    update_heatmap = main.heatmap_store.update
+    main.heatmap_store.update = lambda *a, **k: None
+    result["tick_without_heatmap"] = measure_ticks(main, args.ticks)
+    main.heatmap_store.update = update_heatmap
+    result["endpoints"] = await measure_endpoints(main, args.requests)
+    result["encode"] = measure_encode(main, max(3, args.requests // 4))
+
+    database.ingest_buffer.close()
+    await main.close_async_database()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Allocation and serialization cost of the air-quality hot path")
+    parser.add_argument("--sensors", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--history-depth", type=int, default=120, help="points of history per sensor")
+    parser.add_argument("--requests", type=int, default=20, help="requests per endpoint case")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "air_quality_bench_alloc"))
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    for name in ("tick", "tick_without_heatmap"):
+        tick = result[name]
+        print(f"{name:20s} {tick['tick_ms']:9.3f} ms  peak {tick['peak_bytes'] / 1024:9.1f} KiB "
+              f"({tick['peak_bytes_per_reading']:.0f} B/reading)  retained {tick['retained_bytes'] / 1024:8.1f} KiB  "
+              f"net blocks {tick['net_blocks']}")
+    for name, case in result["endpoints"].items():
+        print(f"{name:18s} p50={case['p50_ms']:9.3f}ms p95={case['p95_ms']:9.3f}ms  {case['bytes']} bytes")
+    encode = result["encode"]
+    print(f"encode {encode['points']} points: jsonable_encoder+json {encode['jsonable_encoder_json_ms']:.1f}ms, "
+          f"orjson {encode['orjson_ms']:.1f}ms ({encode['speedup']}x)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
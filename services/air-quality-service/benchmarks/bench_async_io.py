@@ -0,0 +1,152 @@
+"""Concurrent request latency with sync vs async data access.
+
+Runs the data access behind the air-quality handlers from many concurrent
+coroutines, first calling the blocking database.py functions on the event loop
+(how handlers used to work) and then the async_database.py equivalents. A
+heartbeat task measures how long the loop was stalled meanwhile.
+
+Uses the same DATABASE_URL / MONGODB_URL / REDIS_URL as the service.
+
+Usage: python benchmarks/bench_async_io.py [--concurrency 100] [--requests 2000] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import database
+import async_database
+
+def summarize(latencies, elapsed, loop_lag):
+    values = np.asarray(latencies) * 1000.0
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+        "max_loop_lag_ms": round(loop_lag * 1000.0, 3),
+    }
+
+async def heartbeat(stop: asyncio.Event, interval: float = 0.005):
+    """Return the worst delay between expected and actual wake-ups"""
+    worst = 0.0
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - expected)
+    return worst
+
+async def run_case(call, concurrency: int, total: int):
+    """Issue requests in waves of `concurrency` simultaneous arrivals.
+
+    Each request's latency runs from its wave's arrival time, so time spent
+    queued behind a blocked event loop is counted, as it is for real clients.
+    """
+    latencies = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(stop))
+
+    async def request(arrived: float):
+        await call()
+        latencies.append(time.perf_counter() - arrived)
+
+    started = time.perf_counter()
+    for offset in range(0, total, concurrency):
+        arrived = time.perf_counter()
+        await asyncio.gather(*(request(arrived) for _ in range(min(concurrency, total - offset))))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return summarize(latencies, elapsed, await monitor)
+
+def build_cases(sensor_ids):
+    since = datetime.utcnow() - timedelta(hours=24)
+
+    async def sync_latest():
+        database.latest_cache._l1.clear()
+        database.get_latest_air_quality_data(sensor_ids=sensor_ids)
+
+    async def async_latest():
+        database.latest_cache._l1.clear()
+        await async_database.get_latest_air_quality_data_async(sensor_ids)
+
+    async def sync_rollups():
+        database.get_air_quality_rollups("5m", since, sensor_ids)
+
+    async def async_rollups():
+        await async_database.get_air_quality_rollups_async("5m", since, sensor_ids)
+
+    async def sync_alert_write():
+        database.save_air_quality_alert(sample_alert())
+
+    async def async_alert_write():
+        await async_database.save_air_quality_alert_async(sample_alert())
+
+    async def sync_sensors():
+        database.get_sensors_from_db()
+
+    async def async_sensors():
+        await async_database.get_sensors_from_db_async()
+
+    return {
+        "latest_readings": (sync_latest, async_latest),
+        "rollups_5m": (sync_rollups, async_rollups),
+        "sensors": (sync_sensors, async_sensors),
+        "alert_write": (sync_alert_write, async_alert_write),
+    }
+
+def sample_alert():
+    return {
+        "event_type": "benchmark",
+        "sensor_id": "benchmark",
+        "location": "benchmark",
+        "message": "benchmark alert",
+        "severity": "moderate",
+        "pm25_value": 30.0,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Sync vs async data access latency under concurrency")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--cases", default="latest_readings,rollups_5m,sensors,alert_write")
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    args = parser.parse_args()
+
+    database.init_database()
+    sensor_ids = [sensor["id"] for sensor in database.get_sensors_from_db()]
+    cases = build_cases(sensor_ids)
+
+    results = {
+        "benchmark": "async_io",
+        "timestamp": datetime.utcnow().isoformat(),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "cases": {},
+    }
+    for name in args.cases.split(","):
+        sync_call, async_call = cases[name]
+        before = await run_case(sync_call, args.concurrency, args.requests)
+        after = await run_case(async_call, args.concurrency, args.requests)
+        results["cases"][name] = {"sync": before, "async": after}
+        print(f"{name:16s} sync  p50={before['p50_ms']:8.2f}ms p99={before['p99_ms']:8.2f}ms "
+              f"loop lag={before['max_loop_lag_ms']:8.2f}ms")
+        print(f"{'':16s} async p50={after['p50_ms']:8.2f}ms p99={after['p99_ms']:8.2f}ms "
+              f"loop lag={after['max_loop_lag_ms']:8.2f}ms")
+
+    await async_database.close_async_database()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,319 @@
+"""Offline throughput and latency suite for the air-quality service.
+
+Runs the FastAPI app in-process against local stand-ins (SQLite, mongomock
+or a local mongod, fakeredis and an in-memory publisher; see standins.py)
+and measures, for each simulated sensor count:
+
+  startup     seconds from importing main to ready, per startup step
+  ingest      readings/s through the ingestion tick, and end to end
+              including the MongoDB/Redis bulk flush
+  http        /data/current, /sensors/{id}/current and /data/historical latency
+  websocket   fan-out latency from broadcast to the last client at 100/1k/10k clients
+
+Each sensor count runs in its own process so the app starts from scratch.
+Results are written as JSON; --compare flags regressions against an earlier
+results file.
+
+mongomock scans a collection on every upsert, so with it the bulk flush
+is only drained up to 500 sensors (--flush auto); beyond that the flush is
+replaced by a no-op and only the tick path is measured. Point --mongo-url
+at a local mongod for end-to-end numbers at scale.
+
+Usage: python benchmarks/bench_suite.py [--sensors 5,500,5000] [--ticks 5] [--requests 200]
+           [--clients 100,1000,10000] [--mongo-url mongodb://localhost:27017/bench] [--flush auto|drain|skip]
+           [--output results.json] [--compare baseline.json] [--tolerance 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+
+def percentiles(latencies) -> dict:
+    values = np.asarray(latencies) * 1000.0
+    if not len(values):
+        return {}
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+def bench_ingest(main, database, ticks: int, drain: bool) -> dict:
+    sensors = len(main.sensor_registry)
+    if not drain:
+        database.ingest_buffer.flush_fn = lambda batch: None
+    main.run_ingestion_tick()  # warm-up: first-touch allocations and geometry caches
+    database.ingest_buffer.flush()
+
+    tick_times = []
+    started = time.perf_counter()
+    for _ in range(ticks):
+        tick_started = time.perf_counter()
+        main.run_ingestion_tick()
+        tick_times.append(time.perf_counter() - tick_started)
+    ticks_done = time.perf_counter()
+    database.ingest_buffer.flush()
+    finished = time.perf_counter()
+
+    readings = sensors * ticks
+    stats = database.ingest_buffer.stats()
+    return {
+        "readings": readings,
+        "tick": percentiles(tick_times),
+        "tick_readings_per_s": round(readings / (ticks_done - started), 1),
+        "end_to_end_readings_per_s": round(readings / (finished - started), 1) if drain else None,
+        "drain_seconds": round(finished - ticks_done, 4) if drain else None,
+        "flush": "drained" if drain else "skipped",
+        "rejected": stats["rejected"],
+        "flush_errors": stats["errors"],
+    }
+
+async def bench_http(main, requests: int) -> dict:
+    import httpx
+
+    sensor_ids = main.sensor_registry.ids()
+    rng = np.random.default_rng(1)
+    etag = main.snapshot_store.current.etag
+    cases = {
+        "data_current": lambda: ("/data/current", {}),
+        "data_current_304": lambda: ("/data/current", {"If-None-Match": etag}),
+        "sensor_current": lambda: (f"/sensors/{sensor_ids[rng.integers(len(sensor_ids))]}/current", {}),
+        "historical_raw": lambda: (f"/data/historical?hours=1&sensor_id={sensor_ids[rng.integers(len(sensor_ids))]}", {}),
+        "historical_5m": lambda: (
+            f"/data/historical?hours=24&resolution=5m&sensor_id={sensor_ids[rng.integers(len(sensor_ids))]}", {}
+        ),
+    }
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, make in cases.items():
+            latencies = []
+            size = 0
+            for _ in range(requests):
+                path, headers = make()
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code not in (200, 304):
+                    raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+                size = len(response.content)
+            results[name] = {**percentiles(latencies), "bytes": size}
+    return results
+
+class BenchWebSocket:
+    """Just enough of starlette's WebSocket for ConnectionManager; records delivery times"""
+
+    client = None
+
+    def __init__(self, deliveries: list):
+        self.deliveries = deliveries
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        self.deliveries.append(time.perf_counter())
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def bench_websocket(main, clients: int, rounds: int, subscribed: bool) -> dict:
+    from subscriptions import DeltaEncoder, Subscription
+    from ws_fanout import ConnectionManager
+
+    manager = ConnectionManager()
+    encoder = DeltaEncoder()
+    deliveries: list = []
+    sensor_ids = main.sensor_registry.ids()
+    rng = np.random.default_rng(2)
+
+    connections = []
+    for _ in range(clients):
+        connection = await manager.connect(BenchWebSocket(deliveries))
+        if subscribed:
+            picked = rng.choice(len(sensor_ids), size=min(10, len(sensor_ids)), replace=False)
+            manager.subscribe(connection, Subscription(frozenset(sensor_ids[i] for i in picked.tolist()), None))
+        connections.append(connection)
+
+    last_delivery = []
+    per_client = []
+    enqueue = []
+    for _ in range(rounds):
+        snapshot = main.run_ingestion_tick()
+        readings = snapshot.readings
+        message = b'{"type":"air_quality_update","data":' + snapshot.body + b',"timestamp":"bench"}'
+        deliveries.clear()
+        started = time.perf_counter()
+        encoder.begin_tick(readings)
+        reached = manager.broadcast_tick(message.decode(), encoder)
+        enqueue.append(time.perf_counter() - started)
+        while len(deliveries) < reached:
+            await asyncio.sleep(0)
+        per_client.extend(t - started for t in deliveries)
+        last_delivery.append(max(deliveries) - started if deliveries else 0.0)
+
+    for connection in connections:
+        manager.disconnect(connection)
+    stats = manager.stats(limit=0)
+    return {
+        "clients": clients,
+        "mode": "delta" if subscribed else "full",
+        "enqueue": percentiles(enqueue),
+        "delivery": percentiles(per_client),
+        "last_delivery": percentiles(last_delivery),
+        "evicted": stats["evicted"],
+        "dropped_frames": stats["dropped_frames"],
+    }
+
+async def run_one(args) -> dict:
+    import standins
+
+    used = standins.install(
+        args.workdir, mongo_url=args.mongo_url,
+        env={"HISTORY_DEPTH": str(args.history_depth), "LATEST_L1_SIZE": str(max(10000, args.run_one))},
+    )
+    standins.seed_sensors(args.run_one)
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    import database
+    import main
+
+    if not await main.startup.run():
+        raise RuntimeError(f"Startup failed: {main.startup.status()}")
+
+    drain = args.flush == "drain" or (args.flush == "auto" and (args.mongo_url or args.run_one <= 500))
+    result = {"sensors": len(main.sensor_registry), "stand_ins": used}
+    result["startup"] = {
+        "import_to_ready_seconds": main.startup.import_to_ready_seconds,
+        "steps": {name: step["seconds"] for name, step in main.startup.status()["dependencies"].items()},
+    }
+    result["ingest"] = bench_ingest(main, database, args.ticks, drain)
+    result["http"] = await bench_http(main, args.requests)
+    result["websocket"] = {}
+    for clients in args.client_counts:
+        for subscribed in (False, True):
+            case = await bench_websocket(main, clients, args.ws_rounds, subscribed)
+            result["websocket"][f"{clients}_{case['mode']}"] = case
+
+    database.ingest_buffer.close()
+    await main.close_async_database()
+    return result
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that got worse by more than `tolerance` (latencies up, throughput down)"""
+    regressions = []
+
+    def walk(path, new, old):
+        if isinstance(new, dict) and isinstance(old, dict):
+            for key in new:
+                if key in old:
+                    walk(f"{path}.{key}" if path else key, new[key], old[key])
+            return
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or not old:
+            return
+        if path.endswith(("_ms", "_seconds")):
+            change = (new - old) / old
+        elif path.endswith("_per_s"):
+            change = (old - new) / old
+        else:
+            return
+        if change > tolerance:
+            regressions.append({"metric": path, "baseline": old, "current": new, "worse_by": round(change, 3)})
+
+    for count, run in results["runs"].items():
+        if count in baseline.get("runs", {}):
+            walk(count, run, baseline["runs"][count])
+    return regressions
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline air-quality throughput and latency suite")
+    parser.add_argument("--sensors", default="5,500,5000", help="comma-separated simulated sensor counts")
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="requests per HTTP case")
+    parser.add_argument("--clients", default="100,1000,10000", help="comma-separated WebSocket client counts")
+    parser.add_argument("--ws-rounds", type=int, default=5)
+    parser.add_argument("--history-depth", type=int, default=120, help="ring buffer points per sensor")
+    parser.add_argument("--mongo-url", default=None, help="use this MongoDB instead of mongomock")
+    parser.add_argument("--flush", choices=("auto", "drain", "skip"), default="auto",
+                        help="wait for the MongoDB bulk flush, or replace it with a no-op")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "air_quality_bench"))
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--run-one", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.client_counts = [int(c) for c in args.clients.split(",") if c]
+
+    if args.run_one is not None:
+        print(json.dumps(asyncio.run(run_one(args))))
+        return
+
+    results = {
+        "benchmark": "suite",
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("run_one", "compare", "output")},
+        "runs": {},
+    }
+    for count in [int(c) for c in args.sensors.split(",") if c]:
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--run-one", str(count)]
+        started = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode:
+            sys.stderr.write(completed.stderr)
+            raise SystemExit(f"Run with {count} sensors failed")
+        run = json.loads(completed.stdout.strip().splitlines()[-1])
+        results["runs"][str(count)] = run
+
+        ingest = run["ingest"]
+        end_to_end = ingest["end_to_end_readings_per_s"]
+        print(f"{count:>6} sensors  ingest {ingest['tick_readings_per_s']:>10.0f} readings/s "
+              f"(end to end {'skipped' if end_to_end is None else f'{end_to_end:.0f}'})  "
+              f"ready {run['startup']['import_to_ready_seconds']:.3f}s after import  "
+              f"[{time.perf_counter() - started:.1f}s]")
+        for name, case in run["http"].items():
+            print(f"{'':16s}{name:18s} p50={case['p50_ms']:8.3f}ms p99={case['p99_ms']:8.3f}ms")
+        for name, case in run["websocket"].items():
+            print(f"{'':16s}ws {name:15s} last p50={case['last_delivery']['p50_ms']:8.3f}ms "
+                  f"p99={case['last_delivery']['p99_ms']:8.3f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+                  f"({regression['worse_by']:+.0%})")
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import msgpack
+import redis
+
+SCALE_OUT = os.getenv("SCALE_OUT", "false").lower() == "true"  # several workers or replicas share one Redis
+CLUSTER_CHANNEL = os.getenv("CLUSTER_CHANNEL", "air_quality:cluster")
+LEADER_LOCK_KEY = os.getenv("LEADER_LOCK_KEY", "air_quality:ingestion_leader")
+LEADER_LOCK_TTL = float(os.getenv("LEADER_LOCK_TTL", "10"))  # seconds; renewed every third of it
+CLUSTER_MAX_BACKOFF = float(os.getenv("CLUSTER_MAX_BACKOFF", "30"))
+CLUSTER_PUBLISH_QUEUE = int(os.getenv("CLUSTER_PUBLISH_QUEUE", "256"))  # messages waiting for the sender thread
+
+# Extend or delete the lock only while this node still holds it
+RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], None]
+
+class Cluster:
+    """Coordinates uvicorn workers and replicas that share one Redis.
+
+    One node at a time holds the leader lock (SET NX PX, renewed with a
+    compare-and-expire script) and runs the ingestion loop. Every node
+    publishes what it ingested as msgpack messages on one pub/sub channel.
+    A subscriber thread hands other nodes' messages to the event loop, where
+    the handler registered for the message kind applies them to that node's
+    in-memory state. Outgoing messages are queued and sent, in order, by a
+    sender thread, so the event loop never waits on Redis.
+
+    When disabled the node is always the leader and `publish` does nothing,
+    so a single process behaves exactly as before.
+    """
+
+    def __init__(self, client: redis.Redis, enabled: bool = SCALE_OUT, channel: str = CLUSTER_CHANNEL,
+                 lock_key: str = LEADER_LOCK_KEY, lock_ttl: float = LEADER_LOCK_TTL,
+                 max_backoff: float = CLUSTER_MAX_BACKOFF, publish_queue: int = CLUSTER_PUBLISH_QUEUE):
+        self.client = client
+        self.enabled = enabled
+        self.channel = channel
+        self.lock_key = lock_key
+        self.lock_ttl = lock_ttl
+        self.max_backoff = max_backoff
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.handlers: Dict[str, Handler] = {}
+
+        self._leader = not enabled
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._sender: Optional[threading.Thread] = None
+        self._outbox: "queue.Queue[Dict[str, Any]]" = queue.Queue(publish_queue)
+        self._stopping = threading.Event()
+        self._subscribed = threading.Event()
+
+        self._published = 0
+        self._publish_errors = 0
+        self._publish_dropped = 0
+        self._received = 0
+        self._handler_errors = 0
+        self._leader_changes = 0
+        self._last_message_lag = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader
+
+    def on(self, kind: str):
+        """Register the handler for messages of `kind` from other nodes"""
+        def decorator(fn: Handler) -> Handler:
+            self.handlers[kind] = fn
+            return fn
+        return decorator
+
+    def publish(self, kind: str, message: Dict[str, Any]):
+        """Queue a message for every other node; drops and errors are counted, never raised"""
+        if not self.enabled:
+            return
+        try:
+            self._outbox.put_nowait({"node": self.node_id, "kind": kind, "sent": time.time(), **message})
+        except queue.Full:
+            self._publish_dropped += 1
+            logger.warning(f"Cluster publish queue full, dropped {kind} message")
+
+    def _send(self):
+        while not (self._stopping.is_set() and self._outbox.empty()):
+            try:
+                message = self._outbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.client.publish(self.channel, msgpack.packb(message))
+                self._published += 1
+            except redis.RedisError as e:
+                self._publish_errors += 1
+                logger.warning(f"Failed to publish {message['kind']} to {self.channel}: {e}")
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Start the subscriber thread delivering messages onto `loop`, and the sender thread"""
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._loop = loop
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="cluster-subscriber", daemon=True)
+        self._thread.start()
+        self._sender = threading.Thread(target=self._send, name="cluster-publisher", daemon=True)
+        self._sender.start()
+
+    def wait_subscribed(self, timeout: float) -> bool:
+        return self._subscribed.wait(timeout)
+
+    def _listen(self):
+        backoff = 0.0
+        while not self._stopping.is_set():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                self._subscribed.set()
+                backoff = 0.0
+                while not self._stopping.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._receive(message["data"])
+            except redis.RedisError as e:
+                self._subscribed.clear()
+                backoff = min(self.max_backoff, backoff * 2 if backoff else 0.5)
+                logger.warning(f"Cluster subscription lost ({e}), resubscribing in {backoff:.1f}s")
+                self._stopping.wait(backoff)
+            finally:
+                pubsub.close()
+        self._subscribed.clear()
+
+    def _receive(self, payload: bytes):
+        try:
+            message = msgpack.unpackb(payload)
+        except Exception as e:
+            logger.warning(f"Undecodable cluster message: {e}")
+            return
+        if message.get("node") == self.node_id:
+            return
+        self._received += 1
+        self._loop.call_soon_threadsafe(self._dispatch, message)
+
+    def _dispatch(self, message: Dict[str, Any]):
+        self._last_message_lag = time.time() - message.get("sent", time.time())
+        handler = self.handlers.get(message.get("kind"))
+        if handler is None:
+            return
+        try:
+            handler(message)
+        except Exception as e:
+            self._handler_errors += 1
+            logger.error(f"Cluster {message.get('kind')} handler failed: {e}")
+
+    def campaign_once(self) -> bool:
+        """Take or renew the leader lock; returns whether this node leads"""
+        ttl_ms = int(self.lock_ttl * 1000)
+        try:
+            if self._leader:
+                held = bool(self.client.eval(RENEW_SCRIPT, 1, self.lock_key, self.node_id, ttl_ms))
+            else:
+                held = bool(self.client.set(self.lock_key, self.node_id, nx=True, px=ttl_ms))
+        except redis.RedisError as e:
+            # The lock may expire before Redis comes back, so stop leading now rather than risk two leaders
+            logger.warning(f"Leader lock check failed: {e}")
+            held = False
+
+        if held != self._leader:
+            self._leader = held
+            self._leader_changes += 1
+            logger.info(f"Node {self.node_id} {'is now' if held else 'is no longer'} the ingestion leader")
+        return held
+
+    def leader_elsewhere(self) -> bool:
+        """Whether another node holds the leader lock; assumed so when Redis cannot tell"""
+        if not self.enabled:
+            return False
+        try:
+            holder = self.client.get(self.lock_key)
+        except redis.RedisError as e:
+            logger.warning(f"Leader lock lookup failed: {e}")
+            return True
+        if isinstance(holder, bytes):
+            holder = holder.decode()
+        return holder is not None and holder != self.node_id
+
+    async def campaign(self):
+        """Keep trying to lead; the leader renews its lock every third of the TTL"""
+        if not self.enabled:
+            return
+        while not self._stopping.is_set():
+            await asyncio.to_thread(self.campaign_once)
+            await asyncio.sleep(self.lock_ttl / 3)
+
+    def close(self, timeout: float = 5.0):
+        """Send what is queued, stop the subscriber and hand leadership over by releasing the lock"""
+        if not self.enabled:
+            return
+        self._stopping.set()
+        for thread in (self._sender, self._thread):
+            if thread:
+                thread.join(timeout)
+        if self._leader:
+            try:
+                self.client.eval(RELEASE_SCRIPT, 1, self.lock_key, self.node_id)
+            except redis.RedisError as e:
+                logger.warning(f"Failed to release leader lock: {e}")
+            self._leader = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "node_id": self.node_id,
+            "leader": self._leader,
+            "subscribed": self._subscribed.is_set(),
+            "published": self._published,
+            "publish_errors": self._publish_errors,
+            "publish_dropped": self._publish_dropped,
+            "publish_queue": self._outbox.qsize(),
+            "received": self._received,
+            "handler_errors": self._handler_errors,
+            "leader_changes": self._leader_changes,
+            "last_message_lag_seconds": round(self._last_message_lag, 6),
+        }
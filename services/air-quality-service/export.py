@@ -0,0 +1,160 @@
+import csv
+import io
+import os
+import re
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))  # cursor batch and rows per chunk
+
+EXPORT_COLUMNS = (
+    "timestamp", "sensor_id", "pm25", "pm10", "o3", "no2", "co", "so2",
+    "temperature", "humidity", "pressure", "aqi", "dominant_pollutant",
+)
+EXPORT_PROJECTION = {"_id": 0, "sensor_id": 1, "timestamp": 1, "data": 1, "aqi": 1, "dominant_pollutant": 1}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_RANGE = re.compile(r"^\s*records\s*=\s*(\d+)\s*-\s*(\d*)\s*$")
+
+def parse_records_range(header: Optional[str]) -> Optional[Tuple[int, Optional[int]]]:
+    """Parse `Range: records=first-[last]` into (first, last); raises ValueError"""
+    if not header:
+        return None
+    match = _RANGE.match(header)
+    if not match:
+        raise ValueError(f"Unsupported range: {header}")
+    first = int(match.group(1))
+    last = int(match.group(2)) if match.group(2) else None
+    if last is not None and last < first:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return first, last
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an offset-aware query time to the naive UTC stored in MongoDB and the segment store"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def to_row(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a stored reading into one export row"""
+    data = document.get("data") or {}
+    timestamp = document["timestamp"]
+    return {
+        "timestamp": timestamp.isoformat() if hasattr(timestamp, "isoformat") else timestamp,
+        "sensor_id": document["sensor_id"],
+        "pm25": data.get("pm25"),
+        "pm10": data.get("pm10"),
+        "o3": data.get("o3"),
+        "no2": data.get("no2"),
+        "co": data.get("co"),
+        "so2": data.get("so2"),
+        "temperature": data.get("temperature"),
+        "humidity": data.get("humidity"),
+        "pressure": data.get("pressure"),
+        "aqi": document.get("aqi", data.get("aqi")),
+        "dominant_pollutant": document.get("dominant_pollutant"),
+    }
+
+def _chunks(documents: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(documents)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield [to_row(document) for document in chunk]
+
+def stream_ndjson(documents: Iterable[Dict[str, Any]], chunk_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    for rows in _chunks(documents, chunk_size):
+        yield b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+def stream_csv(documents: Iterable[Dict[str, Any]], chunk_size: int = EXPORT_BATCH_SIZE,
+               header: bool = True) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+    if header:
+        writer.writeheader()
+    for rows in _chunks(documents, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back out in pieces.
+
+    Parquet footers record absolute offsets, so `tell` keeps counting after
+    the buffered bytes have been drained.
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def stream_parquet(documents: Iterable[Dict[str, Any]], chunk_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """One Arrow record batch, written as one row group, per chunk of documents"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("timestamp", pa.string()),
+        ("sensor_id", pa.string()),
+        *[(column, pa.float64()) for column in EXPORT_COLUMNS[2:-2]],
+        ("aqi", pa.int32()),
+        ("dominant_pollutant", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="snappy")
+    try:
+        for rows in _chunks(documents, chunk_size):
+            batch = pa.RecordBatch.from_pylist(rows, schema=schema)
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+WRITERS = {
+    "ndjson": stream_ndjson,
+    "csv": stream_csv,
+    "parquet": stream_parquet,
+}
@@ -0,0 +1,269 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from history import SensorHistory
+
+FORECAST_METRICS = tuple(m for m in os.getenv("FORECAST_METRICS", "pm25,pm10,aqi").split(",") if m)
+FORECAST_HORIZON_HOURS = int(os.getenv("FORECAST_HORIZON_HOURS", "6"))
+FORECAST_STEP_MINUTES = int(os.getenv("FORECAST_STEP_MINUTES", "15"))  # resolution of the fit and the forecast
+FORECAST_LOOKBACK_HOURS = float(os.getenv("FORECAST_LOOKBACK_HOURS", "24"))
+FORECAST_HARMONICS = int(os.getenv("FORECAST_HARMONICS", "3"))  # daily Fourier pairs; 2+ resolve both rush hours
+FORECAST_RIDGE = float(os.getenv("FORECAST_RIDGE", "1.0"))  # shrinks trend and seasonality on short histories
+FORECAST_MIN_POINTS = int(os.getenv("FORECAST_MIN_POINTS", "8"))  # filled steps a sensor needs to be forecast
+FORECAST_REFIT_INTERVAL = float(os.getenv("FORECAST_REFIT_INTERVAL", "300"))  # seconds between batch refits
+FORECAST_SAMPLE_CHUNK = int(os.getenv("FORECAST_SAMPLE_CHUNK", "100"))  # sensors copied per event loop turn
+
+Samples = Tuple[np.ndarray, np.ndarray]  # (bin keys, (metrics, points) values) copied out of history
+
+SIGNED_METRICS = {"temperature"}  # everything else is clipped at zero
+INTERVAL_Z = 1.96
+
+class Forecast:
+    """Forecasts of every sensor from one batch fit, served until the next refit.
+
+    `mean`, `lower` and `upper` are (metrics, sensors, steps) float32 arrays,
+    NaN for sensors with too little history; `times` holds the epoch seconds
+    of each forecast step.
+    """
+
+    def __init__(self, version: int, etag: str, fitted_at: float, step: float, metrics: Sequence[str],
+                 sensor_ids: List[str], times: np.ndarray, mean: np.ndarray, lower: np.ndarray,
+                 upper: np.ndarray, sigma: np.ndarray, points: np.ndarray, fit_seconds: float):
+        self.version = version
+        self.etag = etag
+        self.fitted_at = fitted_at
+        self.step = step
+        self.metrics = tuple(metrics)
+        self.metric_index = {name: i for i, name in enumerate(self.metrics)}
+        self.sensor_ids = sensor_ids
+        self.sensor_index = {sensor_id: i for i, sensor_id in enumerate(sensor_ids)}
+        self.times = times
+        self.mean = mean
+        self.lower = lower
+        self.upper = upper
+        self.sigma = sigma
+        self.points = points
+        self.fit_seconds = fit_seconds
+
+    def _steps(self, hours: Optional[float]) -> int:
+        if hours is None:
+            return len(self.times)
+        return max(0, min(len(self.times), int(round(hours * 3600 / self.step))))
+
+    def _iso_times(self, steps: int) -> List[str]:
+        return [datetime.fromtimestamp(t).isoformat() for t in self.times[:steps].tolist()]
+
+    def first_above(self, metric: str, threshold: float) -> Dict[str, float]:
+        """Epoch seconds of the first step each sensor is forecast above `threshold`"""
+        mean = self.mean[self.metric_index[metric]]
+        above = mean > threshold
+        hits = np.flatnonzero(above.any(axis=1))
+        first = above[hits].argmax(axis=1)
+        return {self.sensor_ids[i]: float(self.times[j]) for i, j in zip(hits.tolist(), first.tolist())}
+
+    def sensor(self, sensor_id: str, hours: Optional[float] = None,
+               thresholds: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+        """Per-step forecast of one sensor, or None if it has none"""
+        i = self.sensor_index.get(sensor_id)
+        if i is None:
+            return None
+        steps = self._steps(hours)
+        times = self._iso_times(steps)
+        metrics = {}
+        for m, name in enumerate(self.metrics):
+            mean = self.mean[m, i, :steps]
+            if np.isnan(mean).all():
+                continue
+            rows = zip(times, *(a[m, i, :steps].astype(np.float64).round(4).tolist()
+                                for a in (self.mean, self.lower, self.upper)))
+            metric = {
+                "points": int(self.points[m, i]),
+                "residual_std": round(float(self.sigma[m, i]), 4),
+                "forecast": [{"timestamp": ts, "value": v, "lower": lo, "upper": hi} for ts, v, lo, hi in rows],
+            }
+            threshold = (thresholds or {}).get(name)
+            if threshold is not None:
+                above = np.flatnonzero(mean > threshold)
+                metric["threshold"] = threshold
+                metric["exceeds_at"] = times[above[0]] if len(above) else None
+            metrics[name] = metric
+        if not metrics:
+            return None
+        return {
+            "sensor_id": sensor_id,
+            "fitted_at": datetime.fromtimestamp(self.fitted_at).isoformat(),
+            "step_minutes": self.step / 60,
+            "metrics": metrics,
+        }
+
+    def all_sensors(self, metric: str, hours: Optional[float] = None) -> Dict[str, Any]:
+        """One metric for every forecast sensor as parallel value lists"""
+        m = self.metric_index[metric]
+        steps = self._steps(hours)
+        mean = self.mean[m, :, :steps]
+        fitted = np.flatnonzero(~np.isnan(mean).all(axis=1))
+        values = mean[fitted].astype(np.float64).round(4).tolist()
+        return {
+            "metric": metric,
+            "fitted_at": datetime.fromtimestamp(self.fitted_at).isoformat(),
+            "step_minutes": self.step / 60,
+            "timestamps": self._iso_times(steps),
+            "sensors": {self.sensor_ids[i]: row for i, row in zip(fitted.tolist(), values)},
+        }
+
+class Forecaster:
+    """Short-horizon forecasts for all sensors from one batched least-squares fit.
+
+    Each sensor's recent history is averaged into fixed steps and fitted with
+    intercept + linear trend + daily Fourier terms (time-of-day seasonality
+    such as the rush-hour peaks). The design matrix is shared by every sensor,
+    so the per-sensor normal equations are two matrix products solved
+    in one batched np.linalg.solve; empty steps simply get zero weight. A
+    ridge penalty on everything but the intercept keeps trend and seasonality
+    modest while the history is shorter than a day. The interval is
+    +/- 1.96 residual standard deviations.
+
+    `refit` is meant to run on a schedule; readers only ever see the last
+    complete Forecast. The ring buffers are not locked, so a refit in a worker
+    thread takes its points from `sample`, called where history is written.
+    """
+
+    def __init__(self, history: SensorHistory, metrics: Sequence[str] = FORECAST_METRICS,
+                 horizon_hours: float = FORECAST_HORIZON_HOURS, step_minutes: float = FORECAST_STEP_MINUTES,
+                 lookback_hours: float = FORECAST_LOOKBACK_HOURS, harmonics: int = FORECAST_HARMONICS,
+                 ridge: float = FORECAST_RIDGE, min_points: int = FORECAST_MIN_POINTS):
+        unknown = [m for m in metrics if m not in history.fields]
+        if unknown:
+            raise ValueError(f"Unknown forecast metrics: {', '.join(unknown)}")
+        self.history = history
+        self.metrics = tuple(metrics)
+        self.rows = [history.fields.index(m) for m in self.metrics]
+        self.step = step_minutes * 60.0
+        self.lookback_steps = max(1, int(round(lookback_hours * 3600 / self.step)))
+        self.horizon_steps = max(1, int(round(horizon_hours * 3600 / self.step)))
+        self.lookback_seconds = self.lookback_steps * self.step
+        self.harmonics = harmonics
+        self.ridge = ridge
+        self.min_points = max(min_points, 2 + 2 * harmonics)
+        self.current: Optional[Forecast] = None
+        self.version = 0
+        self._boot = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+
+    def design(self, times: np.ndarray, now: float) -> np.ndarray:
+        """(len(times), features) matrix: intercept, trend, then sin/cos of the local time of day"""
+        hours = ((times + time.localtime(now).tm_gmtoff) % 86400) / 3600
+        columns = [np.ones_like(times), (times - now) / self.lookback_seconds]
+        for k in range(1, self.harmonics + 1):
+            angle = 2 * np.pi * k * hours / 24
+            columns += [np.sin(angle), np.cos(angle)]
+        return np.stack(columns, axis=1)
+
+    def _first_step(self, now: float) -> int:
+        return int(now // self.step) - self.lookback_steps + 1
+
+    def sample(self, sensor_ids: List[str], now: float, offset: int = 0) -> Samples:
+        """Copy the points a refit at `now` uses out of the history, keyed by sensor and step.
+
+        Sensors are numbered from `offset`, so a long sensor list can be
+        sampled in chunks and the parts joined with `merge_samples`.
+        """
+        n_steps = self.lookback_steps
+        first_step = self._first_step(now)
+        since, until = datetime.fromtimestamp(first_step * self.step), datetime.fromtimestamp(now)
+        positions, times, values = [], [], []
+        for i, sensor_id in enumerate(sensor_ids, offset):
+            timestamps, window = self.history.window(sensor_id, since=since, until=until)
+            if len(timestamps):
+                positions.append(np.full(len(timestamps), i, dtype=np.int64))
+                times.append(timestamps)
+                values.append(window[self.rows])
+        if not times:
+            return self.merge_samples([])
+        steps = (np.concatenate(times) // self.step).astype(np.int64) - first_step
+        return np.concatenate(positions) * n_steps + np.minimum(steps, n_steps - 1), np.concatenate(values, axis=1)
+
+    def merge_samples(self, parts: List[Samples]) -> Samples:
+        """Join samples taken in chunks of one sensor list"""
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros((len(self.metrics), 0), dtype=np.float32)
+        return np.concatenate([keys for keys, _ in parts]), np.concatenate([values for _, values in parts], axis=1)
+
+    def _binned(self, n_sensors: int, samples: Samples):
+        """Per-step means as (metrics, sensors, steps) plus the matching point counts"""
+        n_steps = self.lookback_steps
+        keys, values = samples[0], samples[1].astype(np.float64)
+        shape = (len(self.metrics), n_sensors, n_steps)
+        sums = np.zeros((len(self.metrics), n_sensors * n_steps))
+        counts = np.zeros_like(sums)
+        for m in range(len(self.metrics)):
+            valid = ~np.isnan(values[m])
+            counts[m] = np.bincount(keys[valid], minlength=n_sensors * n_steps)
+            sums[m] = np.bincount(keys[valid], weights=values[m, valid], minlength=n_sensors * n_steps)
+        means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+        return means.reshape(shape), counts.reshape(shape)
+
+    def refit(self, sensor_ids: List[str], now: Optional[float] = None,
+              samples: Optional[Samples] = None) -> Forecast:
+        """Fit every sensor and metric in one pass and publish the result as `current`.
+
+        `samples` must come from `sample(sensor_ids, now)`; without them the
+        history is read here.
+        """
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        last_step = int(now // self.step)
+        first_step = self._first_step(now)
+        if samples is None:
+            samples = self.sample(sensor_ids, now)
+        means, counts = self._binned(len(sensor_ids), samples)
+
+        centers = (np.arange(first_step, last_step + 1) + 0.5) * self.step
+        X = self.design(centers, now)
+        features = X.shape[1]
+        y = means.reshape(-1, self.lookback_steps)
+        w = (counts.reshape(-1, self.lookback_steps) > 0).astype(np.float64)
+        points = w.sum(axis=1)
+
+        penalty = np.full(features, self.ridge)
+        penalty[0] = 1e-9  # intercept unpenalized; keeps empty rows solvable
+        outer = (X[:, :, None] * X[:, None, :]).reshape(len(X), -1)
+        A = (w @ outer).reshape(-1, features, features) + np.diag(penalty)
+        b = (w * y) @ X
+        beta = np.linalg.solve(A, b[..., None])[..., 0]
+
+        residuals = w * (y - beta @ X.T)
+        sigma = np.sqrt((residuals ** 2).sum(axis=1) / np.maximum(points - features, 1))
+
+        times = (np.arange(last_step + 1, last_step + 1 + self.horizon_steps) + 0.5) * self.step
+        mean = beta @ self.design(times, now).T
+        lower = mean - INTERVAL_Z * sigma[:, None]
+        upper = mean + INTERVAL_Z * sigma[:, None]
+
+        shape = (len(self.metrics), len(sensor_ids), self.horizon_steps)
+        mean, lower, upper = (a.reshape(shape) for a in (mean, lower, upper))
+        for m, name in enumerate(self.metrics):
+            if name not in SIGNED_METRICS:
+                np.maximum(mean[m], 0, out=mean[m])
+                np.maximum(lower[m], 0, out=lower[m])
+                np.maximum(upper[m], 0, out=upper[m])
+        unfitted = (points < self.min_points).reshape(shape[:2])
+        for a in (mean, lower, upper):
+            a[unfitted] = np.nan
+
+        with self._lock:
+            self.version += 1
+            forecast = Forecast(
+                self.version, f"{self._boot}-{self.version}", now, self.step, self.metrics, list(sensor_ids),
+                times, mean.astype(np.float32), lower.astype(np.float32), upper.astype(np.float32),
+                sigma.reshape(shape[:2]), points.reshape(shape[:2]).astype(np.int32),
+                time.perf_counter() - started,
+            )
+            self.current = forecast
+        return forecast
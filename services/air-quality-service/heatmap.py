@@ -0,0 +1,214 @@
+import math
+import os
+import struct
+import threading
+import uuid
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from aqi import CATEGORIES, CATEGORY_LIMITS
+
+HEATMAP_WIDTH = int(os.getenv("HEATMAP_WIDTH", "128"))
+HEATMAP_HEIGHT = int(os.getenv("HEATMAP_HEIGHT", "128"))
+HEATMAP_BBOX = os.getenv("HEATMAP_BBOX", "")  # min_lat,min_lon,max_lat,max_lon; empty = sensor extent
+HEATMAP_PADDING = float(os.getenv("HEATMAP_PADDING", "0.02"))  # degrees around the sensor extent
+HEATMAP_POWER = float(os.getenv("HEATMAP_POWER", "2"))
+HEATMAP_METRICS = tuple(m for m in os.getenv("HEATMAP_METRICS", "aqi,pm25,pm10,o3,no2").split(",") if m)
+
+AQI_RANGE = (0.0, 500.0)
+
+BBox = Tuple[float, float, float, float]
+
+def parse_bbox(value: str) -> Optional[BBox]:
+    if not value:
+        return None
+    parts = [float(v) for v in value.split(",")]
+    if (len(parts) != 4 or not all(math.isfinite(v) for v in parts)
+            or parts[0] >= parts[2] or parts[1] >= parts[3]):
+        raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+    return tuple(parts)
+
+def _palette() -> bytes:
+    """256-colour palette: index 0 is transparent (no data), 1..255 follow the AQI colour scale"""
+    colors = [bytes.fromhex(c["color"][1:]) for c in CATEGORIES]
+    limits = np.asarray(CATEGORY_LIMITS, dtype=np.float64)
+    aqi = np.linspace(AQI_RANGE[0], AQI_RANGE[1], 255)
+    categories = np.minimum(np.searchsorted(limits, aqi, side="left"), len(colors) - 1)
+    return b"\x00\x00\x00" + b"".join(colors[i] for i in categories.tolist())
+
+PALETTE = _palette()
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+def encode_png(indices: np.ndarray) -> bytes:
+    """Palette PNG from a (height, width) uint8 array whose first row is the northern edge"""
+    height, width = indices.shape
+    raw = np.empty((height, width + 1), dtype=np.uint8)
+    raw[:, 0] = 0  # filter type None on every scanline
+    raw[:, 1:] = indices
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+        _png_chunk(b"PLTE", PALETTE),
+        _png_chunk(b"tRNS", b"\x00"),
+        _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+class HeatmapFrame:
+    """Interpolated grids of one ingestion tick, with lazily encoded and memoized bodies"""
+
+    def __init__(self, version: int, etag: str, bbox: BBox, width: int, height: int,
+                 grids: Dict[str, np.ndarray]):
+        self.version = version
+        self.etag = etag
+        self.bbox = bbox
+        self.width = width
+        self.height = height
+        self.grids = grids
+        self._bodies: Dict[Tuple[str, str], bytes] = {}
+        self._lock = threading.Lock()
+
+    def value_range(self, metric: str) -> Tuple[float, float]:
+        if metric == "aqi":
+            return AQI_RANGE
+        grid = self.grids[metric]
+        if np.isnan(grid).all():
+            return 0.0, 0.0
+        return float(np.nanmin(grid)), float(np.nanmax(grid))
+
+    def body(self, metric: str, format: str) -> bytes:
+        key = (metric, format)
+        body = self._bodies.get(key)
+        if body is None:
+            with self._lock:
+                body = self._bodies.get(key)
+                if body is None:
+                    body = self._encode(metric, format)
+                    self._bodies[key] = body
+        return body
+
+    def _encode(self, metric: str, format: str) -> bytes:
+        grid = self.grids[metric][::-1]  # rows run north to south
+        if format == "f32":
+            return grid.astype("<f4").tobytes()
+        low, high = self.value_range(metric)
+        scaled = (grid - low) / (high - low) if high > low else np.zeros_like(grid)
+        indices = np.where(np.isnan(grid), 0, 1 + np.clip(scaled, 0, 1) * 254).astype(np.uint8)
+        return encode_png(indices)
+
+class HeatmapStore:
+    """Inverse-distance-weighted interpolation of sensor readings onto a lat/lon grid.
+
+    Sensors are snapped to their grid cell, which turns IDW into two
+    convolutions with one fixed distance kernel: sum(w * value) / sum(w).
+    The kernel's FFT is kept until the sensor set changes, so a tick costs a
+    few FFTs of the grid whatever the number of sensors. The grid is
+    recomputed once per ingestion tick and served from memory.
+    """
+
+    def __init__(self, width: int = HEATMAP_WIDTH, height: int = HEATMAP_HEIGHT,
+                 bbox: Optional[BBox] = parse_bbox(HEATMAP_BBOX), power: float = HEATMAP_POWER,
+                 metrics: Sequence[str] = HEATMAP_METRICS):
+        self.width = width
+        self.height = height
+        self.fixed_bbox = bbox
+        self.power = power
+        self.metrics = tuple(metrics)
+        self.version = 0
+        self.current: Optional[HeatmapFrame] = None
+        self._boot = uuid.uuid4().hex[:8]
+        self._geometry_key = None
+        self._bbox_in_use: Optional[BBox] = None
+        self._cells: Optional[np.ndarray] = None  # flat cell index per sensor, -1 outside the grid
+        self._kernel: Optional[np.ndarray] = None
+
+    def _bbox(self, lat: np.ndarray, lon: np.ndarray) -> BBox:
+        if self.fixed_bbox:
+            return self.fixed_bbox
+        pad = HEATMAP_PADDING
+        return (float(lat.min()) - pad, float(lon.min()) - pad, float(lat.max()) + pad, float(lon.max()) + pad)
+
+    def _prepare(self, key, coordinates: List[Sequence[float]]):
+        if key == self._geometry_key:
+            return
+        lat = np.array([c[0] for c in coordinates], dtype=np.float64)
+        lon = np.array([c[1] for c in coordinates], dtype=np.float64)
+        bbox = self._bbox(lat, lon)
+        cell_lat = (bbox[2] - bbox[0]) / self.height
+        cell_lon = (bbox[3] - bbox[1]) / self.width
+
+        row = np.floor((lat - bbox[0]) / cell_lat).astype(np.int64)
+        col = np.floor((lon - bbox[1]) / cell_lon).astype(np.int64)
+        inside = (row >= 0) & (row < self.height) & (col >= 0) & (col < self.width)
+        self._cells = np.where(inside, row * self.width + col, -1)
+
+        # Distance kernel over every offset between two cells, laid out for a
+        # circular convolution twice the grid size (which is then exactly linear).
+        # Longitude is scaled so distances are roughly isotropic; the floor of a
+        # quarter cell keeps a sensor's own cell finite.
+        scale = np.cos(np.radians((bbox[0] + bbox[2]) / 2))
+        dy = np.fft.fftfreq(2 * self.height, 1 / (2 * self.height)) * cell_lat
+        dx = np.fft.fftfreq(2 * self.width, 1 / (2 * self.width)) * cell_lon * scale
+        floor = (min(cell_lat, cell_lon * scale) / 4) ** 2
+        d2 = dy[:, None] ** 2 + dx[None, :] ** 2 + floor
+        self._kernel = np.fft.rfft2(np.power(d2, -self.power / 2))
+
+        self._bbox_in_use = bbox
+        self._geometry_key = key
+
+    def _interpolate(self, values: np.ndarray) -> np.ndarray:
+        """(metrics, height, width) grids from (sensors, metrics) values; NaN values are skipped"""
+        cells = self._cells
+        size = self.height * self.width
+        inside = cells >= 0
+        present = np.isfinite(values) & inside[:, None]
+
+        # Per-cell sums of values and of sample counts; metrics reported by the
+        # same sensors (the usual case) share one count channel
+        metrics = len(self.metrics)
+        masks = {}
+        channels = []
+        for j in range(metrics):
+            mask = present[:, j]
+            channels.append(np.bincount(cells[mask], weights=values[mask, j], minlength=size))
+            masks.setdefault(mask.tobytes(), (len(masks), mask))
+        count_of = [masks[present[:, j].tobytes()][0] for j in range(metrics)]
+        for _, mask in masks.values():
+            channels.append(np.bincount(cells[mask], minlength=size).astype(np.float64))
+        stacked = np.stack(channels).reshape(-1, self.height, self.width)
+
+        shape = (2 * self.height, 2 * self.width)
+        convolved = np.fft.irfft2(np.fft.rfft2(stacked, shape) * self._kernel, shape)
+        convolved = convolved[:, :self.height, :self.width]
+        numerator = convolved[:metrics]
+        denominator = convolved[metrics:][count_of]
+
+        has_data = present.any(axis=0)[:, None, None]
+        grid = np.divide(numerator, denominator, out=np.full_like(numerator, np.nan),
+                         where=has_data & (denominator > 0))
+        return grid.astype(np.float32)
+
+    def update(self, registry, readings: Iterable[Tuple[str, Dict[str, float]]]) -> Optional[HeatmapFrame]:
+        """Interpolate this tick's (sensor_id, data) readings at the registry's sensor coordinates"""
+        sensors = registry.all()
+        if not sensors:
+            return None
+        self._prepare((registry.version, id(sensors)), [s["coordinates"] for s in sensors])
+
+        rows = {s["id"]: i for i, s in enumerate(sensors)}
+        values = np.full((len(sensors), len(self.metrics)), np.nan, dtype=np.float64)
+        for sensor_id, data in readings:
+            i = rows.get(sensor_id)
+            if i is not None:
+                values[i] = [data.get(m, np.nan) for m in self.metrics]
+
+        result = self._interpolate(values)
+        grids = {metric: result[j] for j, metric in enumerate(self.metrics)}
+        self.version += 1
+        etag = f"{self._boot}-{self.version}"
+        self.current = HeatmapFrame(self.version, etag, self._bbox_in_use, self.width, self.height, grids)
+        return self.current
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+HISTORY_DEPTH = int(os.getenv("HISTORY_DEPTH", "17280"))  # 24h of 5 second ticks
+
+FIELDS = ("pm25", "pm10", "o3", "no2", "co", "so2", "temperature", "humidity", "pressure", "aqi")
+
+Window = Tuple[np.ndarray, np.ndarray]
+
+class SensorRingBuffer:
+    """Fixed-capacity history of one sensor.
+
+    Timestamps (epoch seconds) live in one float64 array and every field in its
+    own contiguous float32 row of `values`, so an append is two array writes and
+    a point costs 8 + 4 * len(fields) bytes. Readings must be appended in time
+    order (older points are dropped); the oldest point is overwritten once the
+    buffer is full.
+    """
+
+    def __init__(self, capacity: int = HISTORY_DEPTH, fields: Iterable[str] = FIELDS):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((len(self.fields), capacity), np.nan, dtype=np.float32)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, timestamp: float, data: Dict[str, float]) -> bool:
+        return self.append_values(timestamp, [data.get(name, np.nan) for name in self.fields])
+
+    def append_values(self, timestamp: float, row) -> bool:
+        """Append one point given as values aligned with `fields` (NaN where missing)"""
+        if self.size and timestamp < self.timestamps[(self.head - 1) % self.capacity]:
+            return False
+        pos = self.head
+        self.timestamps[pos] = timestamp
+        self.values[:, pos] = row
+        self.head = (pos + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        return True
+
+    def load(self, timestamps: np.ndarray, values: np.ndarray):
+        """Replace the contents with time-ordered points (values as (fields, n)), keeping the newest"""
+        n = min(len(timestamps), self.capacity)
+        self.timestamps[:n] = timestamps[len(timestamps) - n:]
+        self.values[:, :n] = values[:, values.shape[1] - n:]
+        self.values[:, n:] = np.nan
+        self.head = n % self.capacity
+        self.size = n
+
+    def oldest(self) -> Optional[float]:
+        return float(self.timestamps[self._start()]) if self.size else None
+
+    def _start(self) -> int:
+        return (self.head - self.size) % self.capacity
+
+    def _search(self, timestamp: float, side: str) -> int:
+        """Logical index of `timestamp` via binary search over the two sorted runs"""
+        start = self._start()
+        if start + self.size <= self.capacity:
+            run = self.timestamps[start:start + self.size]
+            return int(np.searchsorted(run, timestamp, side=side))
+
+        older = self.timestamps[start:]
+        newer = self.timestamps[:self.head]
+        if timestamp < newer[0]:
+            return int(np.searchsorted(older, timestamp, side=side))
+        return len(older) + int(np.searchsorted(newer, timestamp, side=side))
+
+    def _slice(self, lo: int, hi: int) -> Window:
+        """Return logical range [lo, hi); a view unless the range wraps"""
+        if hi <= lo:
+            return self.timestamps[:0], self.values[:, :0]
+        start = self._start()
+        a = (start + lo) % self.capacity
+        b = a + (hi - lo)
+        if b <= self.capacity:
+            return self.timestamps[a:b], self.values[:, a:b]
+        b -= self.capacity
+        return (
+            np.concatenate((self.timestamps[a:], self.timestamps[:b])),
+            np.concatenate((self.values[:, a:], self.values[:, :b]), axis=1),
+        )
+
+    def window(self, since: Optional[float] = None, until: Optional[float] = None,
+               limit: Optional[int] = None) -> Window:
+        """Points with since <= timestamp <= until, newest `limit` of them"""
+        lo = self._search(since, "left") if since is not None and self.size else 0
+        hi = self._search(until, "right") if until is not None and self.size else self.size
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return self._slice(lo, hi)
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        if not self.size:
+            return None
+        pos = (self.head - 1) % self.capacity
+        return float(self.timestamps[pos]), self.values[:, pos]
+
+class SensorHistory:
+    """Per-sensor ring buffers keyed by sensor id"""
+
+    def __init__(self, capacity: int = HISTORY_DEPTH, fields: Iterable[str] = FIELDS):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._buffers: Dict[str, SensorRingBuffer] = {}
+        self._lock = threading.Lock()
+        self.complete_since = time.time()  # every point recorded since then went through `append`
+
+    def _buffer(self, sensor_id: str) -> SensorRingBuffer:
+        buffer = self._buffers.get(sensor_id)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.setdefault(sensor_id, SensorRingBuffer(self.capacity, self.fields))
+        return buffer
+
+    def append(self, sensor_id: str, timestamp: datetime, data: Dict[str, float]) -> bool:
+        """Append a reading; False if it is older than the sensor's latest point"""
+        return self._buffer(sensor_id).append(timestamp.timestamp(), data)
+
+    def append_values(self, sensor_id: str, timestamp: float, row) -> bool:
+        """Append epoch seconds and a row aligned with `fields`; False if out of order"""
+        return self._buffer(sensor_id).append_values(timestamp, row)
+
+    def load(self, sensor_id: str, timestamps: np.ndarray, values: np.ndarray):
+        """Replace a sensor's history with time-ordered points, e.g. reloaded from disk"""
+        self._buffer(sensor_id).load(timestamps, values)
+
+    def covers(self, sensor_id: str, since: float) -> bool:
+        """True if the sensor's buffer still holds every point it was given since `since`"""
+        if since < self.complete_since:
+            return False
+        buffer = self._buffers.get(sensor_id)
+        return buffer is None or buffer.size < buffer.capacity or buffer.oldest() <= since
+
+    def window(self, sensor_id: str, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, limit: Optional[int] = None) -> Window:
+        buffer = self._buffers.get(sensor_id)
+        if buffer is None:
+            return np.zeros(0, dtype=np.float64), np.zeros((len(self.fields), 0), dtype=np.float32)
+        return buffer.window(
+            since.timestamp() if since else None,
+            until.timestamp() if until else None,
+            limit,
+        )
+
+    def latest(self, sensor_id: str) -> Optional[Tuple[float, np.ndarray]]:
+        buffer = self._buffers.get(sensor_id)
+        return buffer.latest() if buffer else None
+
+    def sensor_ids(self) -> List[str]:
+        return list(self._buffers)
+
+def window_to_records(fields: Tuple[str, ...], timestamps: np.ndarray, values: np.ndarray) -> List[dict]:
+    """Turn a window into [{"timestamp": iso, "data": {...}}] without per-point models"""
+    times = [datetime.fromtimestamp(t).isoformat() for t in timestamps.tolist()]
+    columns = values.astype(np.float64).round(4).T.tolist()
+    return [
+        {"timestamp": ts, "data": {k: v for k, v in zip(fields, row) if v == v}}
+        for ts, row in zip(times, columns)
+    ]
@@ -0,0 +1,143 @@
+import os
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+from pydantic import Field, TypeAdapter, ValidationError
+from typing_extensions import Annotated, NotRequired, TypedDict
+
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(32 * 1024 * 1024)))  # decompressed body limit
+INGEST_MAX_READINGS = int(os.getenv("INGEST_MAX_READINGS", "100000"))
+INGEST_MAX_CLOCK_SKEW = float(os.getenv("INGEST_MAX_CLOCK_SKEW", "300"))  # seconds a reading may be ahead of us
+INGEST_MAX_ERRORS = 20  # rejected readings described in a response
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))  # readings processed between yields to the event loop
+
+EPOCH = datetime(1970, 1, 1)
+
+Concentration = Annotated[float, Field(ge=0, le=100000, allow_inf_nan=False)]
+Measurement = Annotated[float, Field(allow_inf_nan=False)]
+
+class Measurements(TypedDict, total=False):
+    pm25: Concentration
+    pm10: Concentration
+    o3: Concentration
+    no2: Concentration
+    co: Concentration
+    so2: Concentration
+    temperature: Measurement
+    humidity: Annotated[float, Field(ge=0, le=100, allow_inf_nan=False)]
+    pressure: Annotated[float, Field(gt=0, allow_inf_nan=False)]
+
+class IngestReading(TypedDict):
+    sensor_id: Annotated[str, Field(min_length=1, max_length=128)]
+    timestamp: NotRequired[datetime]
+    data: Measurements
+
+# TypedDicts validate straight into plain dicts: no model instance per reading
+reading_adapter = TypeAdapter(IngestReading)
+batch_adapter = TypeAdapter(List[IngestReading])
+
+class IngestError(Exception):
+    """The request body as a whole is unusable"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """Undo Content-Encoding gzip/deflate without inflating past INGEST_MAX_BYTES"""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "x-gzip", "deflate"):
+        wbits = 16 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS
+        inflater = zlib.decompressobj(wbits)
+        try:
+            data = inflater.decompress(body, INGEST_MAX_BYTES + 1)
+        except zlib.error as e:
+            raise IngestError(400, f"Invalid {encoding} body: {e}")
+        if len(data) <= INGEST_MAX_BYTES and not inflater.eof:
+            raise IngestError(400, f"Truncated {encoding} body")
+    else:
+        raise IngestError(415, f"Unsupported Content-Encoding: {content_encoding}")
+
+    if len(data) > INGEST_MAX_BYTES:
+        raise IngestError(413, f"Body exceeds {INGEST_MAX_BYTES} bytes")
+    return data
+
+def _describe(error: Dict[str, Any], offset: int) -> Tuple[Optional[int], Dict[str, Any]]:
+    """Index within the chunk and a payload-free description of one pydantic error"""
+    loc = error.get("loc", ())
+    index = loc[0] if loc and isinstance(loc[0], int) else None
+    field = ".".join(str(part) for part in loc[1:]) or None
+    return index, {"index": None if index is None else offset + index, "field": field, "error": error.get("msg")}
+
+def parse_batch(body: bytes, content_type: Optional[str]) -> Tuple[List[IngestReading], List[Dict[str, Any]], int]:
+    """Validate a JSON or msgpack array of readings in bulk.
+
+    Returns the valid readings, up to INGEST_MAX_ERRORS rejection descriptions
+    and the number of rejected readings. The array is validated with one
+    TypeAdapter call per INGEST_CHUNK_SIZE readings: pydantic holds the GIL for
+    a whole call, so the thread running this lets the event loop in between.
+    Only in a chunk that fails are the invalid entries located and the rest
+    validated again.
+    """
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type in ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack"):
+        import msgpack
+        try:
+            items = msgpack.unpackb(body, raw=False, timestamp=3)
+        except Exception as e:
+            raise IngestError(400, f"Invalid msgpack body: {e}")
+    elif media_type == "application/json":
+        try:
+            items = orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise IngestError(400, f"Invalid JSON body: {e}")
+    else:
+        raise IngestError(415, f"Unsupported Content-Type: {content_type}")
+
+    if not isinstance(items, list):
+        raise IngestError(422, "Body must be an array of readings")
+    if len(items) > INGEST_MAX_READINGS:
+        raise IngestError(413, f"Batch exceeds {INGEST_MAX_READINGS} readings")
+
+    readings: List[IngestReading] = []
+    described = []
+    rejected = 0
+    for start in range(0, len(items), INGEST_CHUNK_SIZE):
+        chunk = items[start:start + INGEST_CHUNK_SIZE]
+        try:
+            readings.extend(batch_adapter.validate_python(chunk))
+            continue
+        except ValidationError as e:
+            errors = e.errors(include_input=False, include_url=False)
+
+        bad = set()
+        for error in errors:
+            index, description = _describe(error, start)
+            if index is None:
+                raise IngestError(422, error.get("msg", "Invalid body"))
+            if index not in bad and len(described) < INGEST_MAX_ERRORS:
+                described.append(description)
+            bad.add(index)
+        readings.extend(batch_adapter.validate_python([item for i, item in enumerate(chunk) if i not in bad]))
+        rejected += len(bad)
+    return readings, described, rejected
+
+def reading_times(readings: List[IngestReading], now: datetime) -> np.ndarray:
+    """Epoch seconds of each reading; naive timestamps are UTC, missing ones are `now`"""
+    default = now.timestamp()
+    times = np.empty(len(readings), dtype=np.float64)
+    for i, reading in enumerate(readings):
+        timestamp = reading.get("timestamp")
+        if timestamp is None:
+            times[i] = default
+        elif timestamp.tzinfo is None:
+            times[i] = (timestamp - EPOCH).total_seconds()
+        else:
+            times[i] = timestamp.timestamp()
+    return times
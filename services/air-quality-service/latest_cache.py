@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+
+KEY_PREFIX = "air_quality:"
+KEY_SUFFIX = ":latest"
+
+def cache_key(sensor_id: str) -> str:
+    return f"{KEY_PREFIX}{sensor_id}{KEY_SUFFIX}"
+
+def encode_reading(document: Dict[str, Any]) -> bytes:
+    """Serialize a reading document to compact JSON bytes, dropping the Mongo _id"""
+    return orjson.dumps({k: v for k, v in document.items() if k != "_id"})
+
+def decode_reading(raw: bytes) -> Dict[str, Any]:
+    document = orjson.loads(raw)
+    if isinstance(document.get("timestamp"), str):
+        document["timestamp"] = datetime.fromisoformat(document["timestamp"])
+    return document
+
+class LatestReadingCache:
+    """Latest reading per sensor: an in-process TTL/LRU layer in front of Redis.
+
+    Local writes replace the L1 entry immediately; entries written by other
+    processes are picked up once the short L1 TTL expires. Misses are fetched
+    from Redis with a single MGET.
+    """
+
+    def __init__(self, redis_client, ttl: int = 300, l1_size: int = 10000, l1_ttl: float = 2.0):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self._l1: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._l1_hits = 0
+        self._l2_hits = 0
+        self._misses = 0
+        self._lookups = 0
+        self._lookup_seconds_total = 0.0
+        self._lookup_seconds_max = 0.0
+        self._redis_errors = 0
+
+    @staticmethod
+    def _older(document: Dict[str, Any], entry: Optional[tuple]) -> bool:
+        """Whether the L1 entry already holds a newer reading than `document`"""
+        if entry is None:
+            return False
+        cached, timestamp = entry[1].get("timestamp"), document.get("timestamp")
+        return cached is not None and timestamp is not None and timestamp < cached
+
+    def put(self, sensor_id: str, document: Dict[str, Any]):
+        """Record a freshly written reading in the local layer, unless a newer one is cached"""
+        document = {k: v for k, v in document.items() if k != "_id"}
+        with self._lock:
+            if self._older(document, self._l1.get(sensor_id)):
+                return
+            self._l1[sensor_id] = (time.monotonic() + self.l1_ttl, document)
+            self._l1.move_to_end(sensor_id)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def put_many(self, documents: Iterable[Dict[str, Any]]):
+        """Record several freshly written readings under one lock, skipping ones older than cached"""
+        expires = time.monotonic() + self.l1_ttl
+        with self._lock:
+            for document in documents:
+                sensor_id = document["sensor_id"]
+                if self._older(document, self._l1.get(sensor_id)):
+                    continue
+                self._l1[sensor_id] = (expires, {k: v for k, v in document.items() if k != "_id"})
+                self._l1.move_to_end(sensor_id)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def write_pipelined(self, pipe, documents: Iterable[Dict[str, Any]]):
+        """Queue SETEX commands for the given readings on a Redis pipeline"""
+        for document in documents:
+            pipe.setex(cache_key(document["sensor_id"]), self.ttl, encode_reading(document))
+
+    def get(self, sensor_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_many([sensor_id]).get(sensor_id)
+
+    def get_many(self, sensor_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Latest readings for the given sensors; missing sensors are omitted"""
+        started = time.perf_counter()
+        found, missing = self._lookup_l1(sensor_ids)
+        if missing:
+            try:
+                raw_values = self.redis.mget([cache_key(sensor_id) for sensor_id in missing])
+            except Exception:
+                self._redis_errors += 1
+                raw_values = [None] * len(missing)
+            self._absorb(found, missing, raw_values)
+        self._record_lookup(started)
+        return found
+
+    async def aget_many(self, async_redis, sensor_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Same as get_many, but fetches L1 misses through a redis.asyncio client"""
+        started = time.perf_counter()
+        found, missing = self._lookup_l1(sensor_ids)
+        if missing:
+            try:
+                raw_values = await async_redis.mget([cache_key(sensor_id) for sensor_id in missing])
+            except Exception:
+                self._redis_errors += 1
+                raw_values = [None] * len(missing)
+            self._absorb(found, missing, raw_values)
+        self._record_lookup(started)
+        return found
+
+    def _lookup_l1(self, sensor_ids: List[str]):
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        now = time.monotonic()
+        with self._lock:
+            for sensor_id in sensor_ids:
+                entry = self._l1.get(sensor_id)
+                if entry and entry[0] > now:
+                    self._l1.move_to_end(sensor_id)
+                    found[sensor_id] = entry[1]
+                else:
+                    missing.append(sensor_id)
+            self._l1_hits += len(found)
+        return found, missing
+
+    def _absorb(self, found: Dict[str, Dict[str, Any]], missing: List[str], raw_values: List[Optional[bytes]]):
+        for sensor_id, raw in zip(missing, raw_values):
+            if raw is None:
+                self._misses += 1
+                continue
+            document = decode_reading(raw)
+            found[sensor_id] = document
+            self._l2_hits += 1
+            self.put(sensor_id, document)
+
+    def _record_lookup(self, started: float):
+        elapsed = time.perf_counter() - started
+        self._lookups += 1
+        self._lookup_seconds_total += elapsed
+        self._lookup_seconds_max = max(self._lookup_seconds_max, elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self._l1_hits + self._l2_hits + self._misses
+        return {
+            "l1_entries": len(self._l1),
+            "l1_size": self.l1_size,
+            "l1_hits": self._l1_hits,
+            "l2_hits": self._l2_hits,
+            "misses": self._misses,
+            "hit_ratio": round((self._l1_hits + self._l2_hits) / requests, 4) if requests else 0.0,
+            "redis_errors": self._redis_errors,
+            "lookups": self._lookups,
+            "avg_lookup_seconds": round(self._lookup_seconds_total / self._lookups, 6) if self._lookups else 0.0,
+            "max_lookup_seconds": round(self._lookup_seconds_max, 6),
+        }
@@ -0,0 +1,216 @@
+import functools
+import inspect
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Log-spaced from 50µs to 10s: hot-path stages sit at the low end, flushes at the high end
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]  # name, type, help, samples
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+class _HistogramSeries:
+    """Bucket counts for one label combination"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding rank q"""
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class Histogram:
+    """Latency histogram with Prometheus cumulative buckets plus p50/p95/p99 estimates"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> _HistogramSeries:
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, _HistogramSeries(self.buckets))
+        return series
+
+    def observe(self, value: float, *labels: str):
+        self.labels(*labels).observe(value)
+
+    def collect(self) -> List[Family]:
+        buckets: List[Sample] = []
+        quantiles: List[Sample] = []
+        for values, series in sorted(self._series.items()):
+            labels = dict(zip(self.labelnames, values))
+            with series.lock:
+                counts = list(series.counts)
+                total_sum, total = series.sum, series.count
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                buckets.append(({**labels, "le": _format_value(bound)}, cumulative))
+            buckets.append(({**labels, "__suffix__": "_sum"}, total_sum))
+            buckets.append(({**labels, "__suffix__": "_count"}, total))
+            for q in QUANTILES:
+                quantiles.append(({**labels, "quantile": str(q)}, series.quantile(q)))
+        return [
+            (self.name, "histogram", self.help, buckets),
+            (f"{self.name}_quantile", "gauge", f"{self.help} (estimated quantiles)", quantiles),
+        ]
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[Family]:
+        with self._lock:
+            items = sorted(self._values.items())
+        samples = [(dict(zip(self.labelnames, values)), value) for values, value in items]
+        return [(self.name, "counter", self.help, samples)]
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors and renders the Prometheus text format"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(self.prefix + name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(self.prefix + name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], Iterable[Family]]):
+        """Register a function returning (name, type, help, samples) families at scrape time"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        families: List[Family] = []
+        for metric in self._metrics:
+            families.extend(metric.collect())
+        for fn in self._collectors:
+            families.extend((self.prefix + name, kind, help, samples) for name, kind, help, samples in fn())
+
+        lines = []
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                suffix = labels.pop("__suffix__", "_bucket" if kind == "histogram" else "")
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(float(value))}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry(prefix="air_quality_")
+
+STAGE_SECONDS = registry.histogram(
+    "stage_seconds", "Latency of air-quality hot-path stages in seconds", labelnames=("stage",)
+)
+STAGE_ERRORS = registry.counter(
+    "stage_errors_total", "Exceptions raised by air-quality hot-path stages", labelnames=("stage",)
+)
+
+@contextmanager
+def stage(name: str):
+    """Time a block as one observation of `name`, counting it as an error if it raises"""
+    series = STAGE_SECONDS.labels(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        series.observe(time.perf_counter() - started)
+
+def timed(name: str):
+    """Decorator form of `stage` for plain and async functions"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def stats_family(name: str, kind: str, help: str, value: float) -> Family:
+    """Single unlabelled sample, for collectors that re-export an existing stats() field"""
+    return name, kind, help, [({}, value)]
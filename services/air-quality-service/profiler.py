@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_INTERVAL = max(float(os.getenv("PROFILER_INTERVAL", "0.001")), 0.0005)  # seconds between stack samples
+PROFILER_MAX_TICKS = int(os.getenv("PROFILER_MAX_TICKS", "12"))  # most ticks one request may profile
+PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a side thread at a fixed interval.
+
+    The profiled code runs untouched (no tracing hooks), so the cost is one
+    `sys._current_frames()` walk per interval. Output is in collapsed-stack
+    format (`outer;inner;leaf count`), ready for flamegraph tools.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, max_depth: int = PROFILER_MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: Optional[int] = None):
+        self._target = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+class ProfileHook:
+    """Profiles the next N ticks when armed at runtime; otherwise a no-op"""
+
+    def __init__(self, enabled: bool = PROFILER_ENABLED, interval: float = PROFILER_INTERVAL):
+        self.enabled = enabled
+        self.interval = interval
+        self._remaining = 0
+        self._profiler: Optional[SamplingProfiler] = None
+        self._started = 0.0
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    def arm(self, ticks: int = 1) -> int:
+        """Profile the next `ticks` ticks, clamped to 1..PROFILER_MAX_TICKS; returns the count armed"""
+        if not self.enabled:
+            raise RuntimeError("Profiling is disabled (PROFILER_ENABLED=false)")
+        self._remaining = min(max(1, ticks), PROFILER_MAX_TICKS)
+        self._profiler = None
+        self._started = 0.0
+        return self._remaining
+
+    @property
+    def armed(self) -> bool:
+        return self._remaining > 0
+
+    @contextmanager
+    def tick(self):
+        if not self._remaining:
+            yield
+            return
+
+        if self._profiler is None:
+            self._profiler = SamplingProfiler(self.interval)
+            self._started = time.time()
+        self._profiler.start()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._profiler.stop()
+            self._remaining -= 1
+            if not self._remaining:
+                self.last_result = {
+                    "started": self._started,
+                    "interval": self.interval,
+                    "samples": sum(self._profiler.samples.values()),
+                    "last_tick_seconds": round(time.perf_counter() - started, 6),
+                    "collapsed": self._profiler.collapsed(),
+                }
+                self._profiler = None
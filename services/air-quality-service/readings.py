@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from aqi import POLLUTANTS
+from history import FIELDS
+
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+POLLUTANT_COLUMNS = [FIELD_INDEX[p] for p in POLLUTANTS]
+AQI_COLUMN = FIELD_INDEX["aqi"]
+
+class ReadingBatch:
+    """Struct-of-arrays batch of readings for the ingestion hot path.
+
+    One row per reading: sensor ids in a list, times as local epoch seconds
+    and every field of history.FIELDS as a column of a (readings, fields)
+    float64 array, NaN where a field was not reported. Stages work on whole
+    columns; per-reading dicts are only built at the edges (MongoDB documents,
+    the JSON snapshot) by `data_dicts`.
+    """
+
+    __slots__ = ("sensor_ids", "times", "values", "dominant")
+
+    def __init__(self, sensor_ids: List[str], times: np.ndarray, values: np.ndarray,
+                 dominant: Optional[np.ndarray] = None):
+        self.sensor_ids = sensor_ids
+        self.times = times
+        self.values = values
+        self.dominant = dominant if dominant is not None else np.full(len(sensor_ids), -1, dtype=np.int8)
+
+    @classmethod
+    def from_dicts(cls, sensor_ids: List[str], readings: Sequence[Dict[str, float]], times) -> "ReadingBatch":
+        """Build from per-reading field dicts; unknown fields are ignored"""
+        values = np.array([[reading.get(name, np.nan) for name in FIELDS] for reading in readings],
+                          dtype=np.float64).reshape(len(readings), len(FIELDS))
+        return cls(list(sensor_ids), np.broadcast_to(np.asarray(times, dtype=np.float64), len(readings)).copy(),
+                   values)
+
+    @classmethod
+    def from_columns(cls, sensor_ids: List[str], times, names: Sequence[str], columns: np.ndarray) -> "ReadingBatch":
+        """Build from a (readings, len(names)) array of the named fields"""
+        values = np.full((len(sensor_ids), len(FIELDS)), np.nan, dtype=np.float64)
+        values[:, [FIELD_INDEX[name] for name in names]] = columns
+        return cls(list(sensor_ids), np.broadcast_to(np.asarray(times, dtype=np.float64), len(sensor_ids)).copy(),
+                   values)
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "ReadingBatch":
+        """Inverse of `to_message`"""
+        n = len(message["sensor_ids"])
+        return cls(list(message["sensor_ids"]), np.frombuffer(message["times"], dtype=np.float64),
+                   np.frombuffer(message["values"], dtype=np.float64).reshape(n, len(FIELDS)),
+                   np.frombuffer(message["dominant"], dtype=np.int8))
+
+    def to_message(self) -> Dict[str, Any]:
+        """Sensor ids and raw column bytes, for shipping a batch to other workers"""
+        return {
+            "sensor_ids": self.sensor_ids,
+            "times": self.times.tobytes(),
+            "values": np.ascontiguousarray(self.values).tobytes(),
+            "dominant": self.dominant.tobytes(),
+        }
+
+    def __len__(self) -> int:
+        return len(self.sensor_ids)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, FIELD_INDEX[name]]
+
+    def columns(self, names: Sequence[str]) -> np.ndarray:
+        return self.values[:, [FIELD_INDEX[name] for name in names]]
+
+    def take(self, index) -> "ReadingBatch":
+        """Rows selected by a slice, mask or index array"""
+        if isinstance(index, slice):
+            sensor_ids = self.sensor_ids[index]
+        else:
+            positions = np.arange(len(self))[index].tolist()
+            sensor_ids = [self.sensor_ids[i] for i in positions]
+        return ReadingBatch(sensor_ids, self.times[index], self.values[index], self.dominant[index])
+
+    def dominant_pollutants(self) -> List[Optional[str]]:
+        return [POLLUTANTS[i] if i >= 0 else None for i in self.dominant.tolist()]
+
+    def data_dicts(self) -> List[Dict[str, Any]]:
+        """Public `data` mapping per reading: reported fields only, AQI as an int"""
+        dicts = []
+        for row in self.values.tolist():
+            data = {name: value for name, value in zip(FIELDS, row) if value == value}
+            if "aqi" in data:
+                data["aqi"] = int(data["aqi"])
+            dicts.append(data)
+        return dicts
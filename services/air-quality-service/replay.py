@@ -0,0 +1,257 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from pymongo import ASCENDING, MongoClient
+
+from database import EPOCH, ensure_load_sensors, mongo_db, readings_query
+from readings import ReadingBatch
+from simulation import SIMULATED_FIELDS, simulate_steps
+
+REPLAY_MODE = os.getenv("REPLAY_MODE", "off").lower()  # off, history or synthetic
+REPLAY_SPEEDUP = float(os.getenv("REPLAY_SPEEDUP", "1"))  # simulated seconds per wall-clock second
+REPLAY_TICK = float(os.getenv("REPLAY_TICK", "1"))  # wall-clock seconds between replayed batches
+REPLAY_START = os.getenv("REPLAY_START")  # ISO time, UTC unless an offset is given
+REPLAY_END = os.getenv("REPLAY_END")  # history only; defaults to now, and REPLAY_START to a day before it
+REPLAY_LOOP = os.getenv("REPLAY_LOOP", "false").lower() == "true"  # start the history window over when done
+REPLAY_RETIME = os.getenv("REPLAY_RETIME", "true").lower() == "true"  # stamp readings with the replay's wall clock
+REPLAY_MONGODB_URL = os.getenv("REPLAY_MONGODB_URL")  # replay another deployment's history; defaults to ours
+REPLAY_SENSORS = int(os.getenv("REPLAY_SENSORS", "1000"))
+REPLAY_MAX_SENSORS = 100000
+REPLAY_SENSOR_PREFIX = os.getenv("REPLAY_SENSOR_PREFIX", "load-")
+REPLAY_SENSOR_INTERVAL = float(os.getenv("REPLAY_SENSOR_INTERVAL", "5"))  # simulated seconds between readings
+REPLAY_WORKERS = int(os.getenv("REPLAY_WORKERS", str(os.cpu_count() or 1)))
+REPLAY_POOL_MIN_READINGS = 50000  # smaller synthetic batches are generated in-process
+REPLAY_CURSOR_BATCH_SIZE = 5000
+
+HISTORY_PROJECTION = {"_id": 0, "sensor_id": 1, "timestamp": 1, "data": 1}
+
+logger = logging.getLogger(__name__)
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of an ISO time; naive times are UTC"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+class HistorySource:
+    """Stored readings between two times, read in (timestamp, sensor_id) order from MongoDB"""
+
+    def __init__(self, collection, start: float, end: float):
+        self.collection = collection
+        self.start = start
+        self.end = end
+        self.exhausted = False
+        self._cursor = None
+        self._pending: Optional[dict] = None
+
+    def rewind(self):
+        if self._cursor is not None:
+            self._cursor.close()
+        self._cursor = None
+        self._pending = None
+        self.exhausted = False
+
+    def batch(self, since: float, until: float) -> Optional[ReadingBatch]:
+        """Readings with timestamp < until; `since` is where the previous batch ended"""
+        if self._cursor is None:
+            query = readings_query(None, datetime.utcfromtimestamp(self.start), datetime.utcfromtimestamp(self.end))
+            self._cursor = self.collection.find(query, HISTORY_PROJECTION, batch_size=REPLAY_CURSOR_BATCH_SIZE).sort(
+                [("timestamp", ASCENDING), ("sensor_id", ASCENDING)]
+            )
+        documents = []
+        document = self._pending
+        self._pending = None
+        while True:
+            if document is None:
+                document = next(self._cursor, None)
+                if document is None:
+                    self.exhausted = True
+                    break
+            if (document["timestamp"] - EPOCH).total_seconds() >= until:
+                self._pending = document
+                break
+            documents.append(document)
+            document = None
+        if not documents:
+            return None
+        times = [(document["timestamp"] - EPOCH).total_seconds() for document in documents]
+        return ReadingBatch.from_dicts([document["sensor_id"] for document in documents],
+                                       [document.get("data") or {} for document in documents], times)
+
+class SyntheticSource:
+    """`count` load-test sensors reporting every `interval` simulated seconds with the
+    simulator's time-of-day profile, generated in a process pool for large batches"""
+
+    def __init__(self, sensor_ids: List[str], start: float, interval: float, workers: int):
+        self.sensor_ids = sensor_ids
+        self.start = start
+        self.end = None
+        self.interval = interval
+        self.workers = max(1, workers)
+        self.exhausted = False
+        self._seeds = np.random.SeedSequence()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def rewind(self):
+        pass
+
+    def _generate(self, times: np.ndarray) -> np.ndarray:
+        count = len(self.sensor_ids)
+        chunks = min(self.workers, count) if count * len(times) >= REPLAY_POOL_MIN_READINGS else 1
+        seeds = [int(seed.generate_state(1)[0]) for seed in self._seeds.spawn(chunks)]
+        if chunks == 1:
+            return simulate_steps(count, times.tolist(), seeds[0])
+        if self._pool is None:
+            # spawn: forking a process that runs database and broker I/O threads is unsafe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        sizes = [len(part) for part in np.array_split(np.arange(count), chunks)]
+        futures = [self._pool.submit(simulate_steps, size, times.tolist(), seed) for size, seed in zip(sizes, seeds)]
+        return np.concatenate([future.result() for future in futures], axis=1)
+
+    def batch(self, since: float, until: float) -> Optional[ReadingBatch]:
+        """One reading per sensor at every multiple of `interval` in [since, until), in time order"""
+        first = np.ceil(since / self.interval) * self.interval
+        times = np.arange(first, until, self.interval)
+        if not len(times):
+            return None
+        values = self._generate(times)
+        count = len(self.sensor_ids)
+        return ReadingBatch.from_columns(self.sensor_ids * len(times), np.repeat(times, count), SIMULATED_FIELDS,
+                                         values.reshape(-1, len(SIMULATED_FIELDS)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+class Replayer:
+    """Feeds recorded or synthetic readings to the ingestion pipeline on a simulated clock.
+
+    The simulated clock starts at REPLAY_START and runs `speedup` times faster
+    than the wall clock; each `next_batch` returns the readings of the next
+    `tick * speedup` simulated seconds. With `retime` their times are moved
+    onto the wall clock, keeping their spacing (compressed by the speed-up),
+    so history, rollups, forecasts and stored data treat them as live. Without
+    it the original times are kept, for replays into an empty offline
+    deployment.
+    """
+
+    def __init__(self, mode: str = REPLAY_MODE, speedup: float = REPLAY_SPEEDUP, tick: float = REPLAY_TICK,
+                 start: Optional[str] = REPLAY_START, end: Optional[str] = REPLAY_END, loop: bool = REPLAY_LOOP,
+                 retime: bool = REPLAY_RETIME, sensors: int = REPLAY_SENSORS,
+                 interval: float = REPLAY_SENSOR_INTERVAL, workers: int = REPLAY_WORKERS):
+        if mode not in ("off", "history", "synthetic"):
+            raise ValueError(f"Unknown REPLAY_MODE: {mode}")
+        if sensors > REPLAY_MAX_SENSORS:
+            raise ValueError(f"REPLAY_SENSORS is limited to {REPLAY_MAX_SENSORS}")
+        self.mode = mode
+        self.enabled = mode != "off"
+        self.speedup = speedup
+        self.tick = tick
+        self.start = parse_time(start)
+        self.end = parse_time(end)
+        self.loop = loop
+        self.retime = retime
+        self.sensors = sensors
+        self.interval = interval
+        self.workers = workers
+        self.source = None
+        self.clock: Optional[float] = None
+        self._client: Optional[MongoClient] = None
+        self.finished = False
+
+        self._last_stamp = 0.0
+        self._batches = 0
+        self._readings = 0
+        self._accepted = 0
+        self._unknown = 0
+        self._overloaded = 0
+        self._loops = 0
+        self._last_generate_seconds = 0.0
+
+    def prepare(self) -> List[str]:
+        """Open the source; returns the synthetic sensor ids, created in PostgreSQL if missing"""
+        if self.mode == "history":
+            end = self.end or time.time()
+            start = self.start or end - 86400
+            if REPLAY_MONGODB_URL:
+                self._client = MongoClient(REPLAY_MONGODB_URL)
+                collection = self._client.smartcity.air_quality_data
+            else:
+                collection = mongo_db.air_quality_data
+            self.source = HistorySource(collection, start, end)
+            sensor_ids = []
+        else:
+            sensor_ids = ensure_load_sensors(self.sensors, REPLAY_SENSOR_PREFIX)
+            self.source = SyntheticSource(sensor_ids, self.start or time.time(), self.interval, self.workers)
+        self.clock = self.source.start
+        logger.info(f"Replaying {self.mode} readings from {datetime.utcfromtimestamp(self.clock).isoformat()}Z "
+                    f"at {self.speedup}x")
+        return sensor_ids
+
+    def next_batch(self) -> Optional[ReadingBatch]:
+        """Readings of the next span of simulated time, or None if it has none"""
+        started = time.perf_counter()
+        since, until = self.clock, self.clock + self.tick * self.speedup
+        if self.source.end is not None:
+            until = min(until, self.source.end)
+        batch = self.source.batch(since, until)
+        self.clock = until
+        self._last_generate_seconds = time.perf_counter() - started
+
+        if self.source.exhausted or (self.source.end is not None and self.clock >= self.source.end):
+            if self.loop:
+                self.source.rewind()
+                self.clock = self.source.start
+                self._loops += 1
+            else:
+                self.finished = True
+
+        if batch is None:
+            return None
+        if self.retime:
+            # The end of the span is now; earlier readings keep their compressed spacing
+            now = time.time()
+            batch.times = np.maximum(now - (until - batch.times) / self.speedup, self._last_stamp)
+            self._last_stamp = now
+        self._batches += 1
+        self._readings += len(batch)
+        return batch
+
+    def processed(self, accepted: int, unknown: int, overloaded: int):
+        """Count what the pipeline did with the last batch"""
+        self._accepted += accepted
+        self._unknown += unknown
+        self._overloaded += overloaded
+
+    def close(self):
+        if isinstance(self.source, SyntheticSource):
+            self.source.close()
+        if self._client is not None:
+            self._client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "speedup": self.speedup,
+            "retime": self.retime,
+            "sensors": len(self.source.sensor_ids) if isinstance(self.source, SyntheticSource) else None,
+            "simulated_time": datetime.utcfromtimestamp(self.clock).isoformat() + "Z" if self.clock else None,
+            "finished": self.finished,
+            "loops": self._loops,
+            "batches": self._batches,
+            "readings": self._readings,
+            "accepted": self._accepted,
+            "unknown_sensor": self._unknown,
+            "overloaded": self._overloaded,
+            "last_generate_seconds": round(self._last_generate_seconds, 6),
+        }
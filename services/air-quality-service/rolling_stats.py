@@ -0,0 +1,186 @@
+import os
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+STATS_EWMA_ALPHA = float(os.getenv("STATS_EWMA_ALPHA", "0.05"))
+ANOMALY_Z_ENTER = float(os.getenv("ANOMALY_Z_ENTER", "3.0"))
+ANOMALY_Z_EXIT = float(os.getenv("ANOMALY_Z_EXIT", "1.5"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "30"))
+
+METRICS = ("pm25", "pm10", "o3", "no2", "co", "so2", "temperature", "humidity", "pressure")
+
+class Transition:
+    """A metric of one sensor entering or leaving the anomalous state"""
+
+    __slots__ = ("sensor_id", "metric", "value", "z", "entered")
+
+    def __init__(self, sensor_id: str, metric: str, value: float, z: float, entered: bool):
+        self.sensor_id = sensor_id
+        self.metric = metric
+        self.value = value
+        self.z = z
+        self.entered = entered
+
+class RollingStats:
+    """Streaming per-sensor, per-metric statistics with z-score anomaly detection.
+
+    Every statistic is a (sensors, metrics) array updated in place, so a tick
+    is a handful of vectorized operations however many sensors report and a
+    sensor costs 45 bytes per metric. Keeps an EWMA with an
+    exponentially weighted variance (the drift-following baseline z-scores
+    are taken against) and a Welford mean/variance over all samples seen.
+
+    A metric turns anomalous when |z| reaches `z_enter` and stays so until
+    |z| falls to `z_exit`, so a value hovering at the threshold does not flap.
+    """
+
+    def __init__(self, metrics: Sequence[str] = METRICS, alpha: float = STATS_EWMA_ALPHA,
+                 z_enter: float = ANOMALY_Z_ENTER, z_exit: float = ANOMALY_Z_EXIT,
+                 min_samples: int = ANOMALY_MIN_SAMPLES, capacity: int = 64):
+        if not 0 < alpha <= 1:
+            raise ValueError(f"alpha must be in (0, 1]: {alpha}")
+        if z_exit > z_enter:
+            raise ValueError("z_exit must not exceed z_enter")
+        self.metrics = tuple(metrics)
+        self.alpha = alpha
+        self.z_enter = z_enter
+        self.z_exit = z_exit
+        self.min_samples = min_samples
+        self._getter = itemgetter(*self.metrics)
+        self.rows: Dict[str, int] = {}
+        self.sensor_ids: List[str] = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        shape = (capacity, len(self.metrics))
+        arrays = {
+            "count": np.zeros(shape, dtype=np.uint32),
+            "mean": np.zeros(shape, dtype=np.float64),
+            "m2": np.zeros(shape, dtype=np.float64),
+            "ewma": np.zeros(shape, dtype=np.float64),
+            "ewvar": np.zeros(shape, dtype=np.float64),
+            "last": np.full(shape, np.nan, dtype=np.float32),
+            "z": np.zeros(shape, dtype=np.float32),
+            "anomalous": np.zeros(shape, dtype=bool),
+        }
+        for name, array in arrays.items():
+            old = getattr(self, name, None)
+            if old is not None:
+                array[:len(old)] = old
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self.sensor_ids)
+
+    def _row_indices(self, sensor_ids: Iterable[str]):
+        indices = []
+        for sensor_id in sensor_ids:
+            row = self.rows.get(sensor_id)
+            if row is None:
+                row = len(self.sensor_ids)
+                if row >= self.capacity:
+                    self._allocate(self.capacity * 2)
+                self.rows[sensor_id] = row
+                self.sensor_ids.append(sensor_id)
+            indices.append(row)
+        if indices and indices[-1] - indices[0] == len(indices) - 1 and indices == list(range(indices[0], indices[-1] + 1)):
+            return slice(indices[0], indices[-1] + 1)  # the usual every-sensor tick; views instead of gathers
+        return np.array(indices, dtype=np.intp)
+
+    def _row(self, reading: Dict[str, float]) -> tuple:
+        try:
+            return self._getter(reading)
+        except KeyError:
+            return tuple(reading.get(m, np.nan) for m in self.metrics)
+
+    def update(self, sensor_ids: Sequence[str], readings: Sequence[Dict[str, float]]) -> List[Transition]:
+        """Fold one reading per sensor into the statistics; returns anomaly state changes"""
+        if not sensor_ids:
+            return []
+        return self.update_values(sensor_ids, np.array([self._row(reading) for reading in readings], dtype=np.float64))
+
+    def update_values(self, sensor_ids: Sequence[str], x: np.ndarray) -> List[Transition]:
+        """Same as update, from a (sensors, metrics) array with NaN for unreported metrics"""
+        if not sensor_ids:
+            return []
+        rows = self._row_indices(sensor_ids)
+        present = np.isfinite(x)
+        x0 = np.where(present, x, 0.0)
+
+        count = self.count[rows]
+        ewma = self.ewma[rows]
+        ewvar = self.ewvar[rows]
+
+        # Score against the baseline before this sample moves it
+        std = np.sqrt(ewvar)
+        z = np.divide(x0 - ewma, std, out=np.zeros_like(x0), where=std > 0)
+        z = np.where(present & (count >= self.min_samples), z, 0.0)
+
+        first = present & (count == 0)
+        diff = x0 - ewma
+        incr = self.alpha * diff
+        new_ewma = np.where(first, x0, np.where(present, ewma + incr, ewma))
+        new_ewvar = np.where(present & ~first, (1 - self.alpha) * (ewvar + diff * incr), ewvar)
+
+        new_count = count + present
+        mean = self.mean[rows]
+        delta = x0 - mean
+        new_mean = np.where(present, mean + delta / np.maximum(new_count, 1), mean)
+        new_m2 = np.where(present, self.m2[rows] + delta * (x0 - new_mean), self.m2[rows])
+
+        was = self.anomalous[rows].copy()
+        magnitude = np.abs(z)
+        now = np.where(was, magnitude > self.z_exit, magnitude >= self.z_enter) | (was & ~present)
+
+        self.count[rows] = new_count
+        self.mean[rows] = new_mean
+        self.m2[rows] = new_m2
+        self.ewma[rows] = new_ewma
+        self.ewvar[rows] = new_ewvar
+        self.last[rows] = np.where(present, x, self.last[rows])
+        self.z[rows] = np.where(present, z, self.z[rows])
+        self.anomalous[rows] = now
+
+        changed_i, changed_j = np.nonzero(now != was)
+        return [
+            Transition(sensor_ids[i], self.metrics[j], float(x[i, j]), float(z[i, j]), bool(now[i, j]))
+            for i, j in zip(changed_i.tolist(), changed_j.tolist())
+        ]
+
+    def snapshot(self, sensor_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Current statistics of one sensor, per metric"""
+        row = self.rows.get(sensor_id)
+        if row is None:
+            return None
+        count = self.count[row].astype(np.float64)
+        variance = np.divide(self.m2[row], count - 1, out=np.zeros_like(count), where=count > 1)
+        result = {}
+        for j, metric in enumerate(self.metrics):
+            if not count[j]:
+                continue
+            result[metric] = {
+                "value": round(float(self.last[row, j]), 4),
+                "ewma": round(float(self.ewma[row, j]), 4),
+                "ewm_std": round(float(np.sqrt(self.ewvar[row, j])), 4),
+                "mean": round(float(self.mean[row, j]), 4),
+                "std": round(float(np.sqrt(variance[j])), 4),
+                "count": int(count[j]),
+                "z_score": round(float(self.z[row, j]), 3),
+                "anomalous": bool(self.anomalous[row, j]),
+            }
+        return result
+
+    def anomalies(self) -> List[Tuple[str, str, float, float]]:
+        """(sensor_id, metric, value, z) for every metric currently anomalous"""
+        rows, cols = np.nonzero(self.anomalous[:len(self.sensor_ids)])
+        return [
+            (self.sensor_ids[i], self.metrics[j], float(self.last[i, j]), float(self.z[i, j]))
+            for i, j in zip(rows.tolist(), cols.tolist())
+        ]
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in
+                   ("count", "mean", "m2", "ewma", "ewvar", "last", "z", "anomalous"))
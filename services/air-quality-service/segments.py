@@ -0,0 +1,507 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from history import FIELDS, Window
+
+SEGMENT_ENABLED = os.getenv("SEGMENT_ENABLED", "true").lower() == "true"
+SEGMENT_DIR = os.getenv("SEGMENT_DIR", "data/segments")
+SEGMENT_SPAN = float(os.getenv("SEGMENT_SPAN", "3600"))  # seconds of readings per segment before rotating
+SEGMENT_CAPACITY = int(os.getenv("SEGMENT_CAPACITY", "1048576"))  # rows preallocated per segment
+SEGMENT_RETENTION_DAYS = float(os.getenv("SEGMENT_RETENTION_DAYS", "7"))
+SEGMENT_WARM_HOURS = float(os.getenv("SEGMENT_WARM_HOURS", "24"))  # history reloaded into memory on restart
+
+MAGIC = b"AQSEG001"
+HEADER = np.dtype([
+    ("magic", "S8"), ("fields", "<u4"), ("compacted", "<u4"), ("capacity", "<u8"), ("count", "<u8"),
+    ("start", "<f8"), ("min_time", "<f8"), ("max_time", "<f8"),
+])
+HEADER_SIZE = 64
+SEGMENT_NAME = re.compile(r"^(\d{10})\.seg$")
+
+logger = logging.getLogger(__name__)
+
+def _layout(capacity: int, fields: int) -> Tuple[int, int, int, int, int]:
+    """Byte offsets of the times, sensors, dominant and values columns, and the file size"""
+    times = HEADER_SIZE
+    sensors = times + 8 * capacity
+    dominant = sensors + 4 * capacity
+    values = (dominant + capacity + 3) // 4 * 4
+    return times, sensors, dominant, values, values + 4 * fields * capacity
+
+class Segment:
+    """One append-only columnar segment file, mapped with numpy.memmap.
+
+    Fixed-width columns after a 64-byte header: float64 epoch seconds, uint32
+    sensor index, int8 dominant pollutant and one float32 column per field.
+    Rows are appended in arrival order and `count` in the header is bumped
+    only after they are written, so a crash at worst loses the rows of the
+    append in flight. Compaction rewrites a sealed segment sorted by
+    (sensor, time) at its exact size; reads of one sensor are then slices of
+    the mapping.
+    """
+
+    def __init__(self, path: str, fields: int, capacity: Optional[int] = None, start: float = 0.0):
+        self.path = path
+        if capacity is not None:
+            size = _layout(capacity, fields)[-1]
+            with open(path, "wb") as f:
+                f.truncate(size)
+            header = np.memmap(path, HEADER, "r+", 0, (1,))
+            header[0] = (MAGIC, fields, 0, capacity, 0, start, np.inf, -np.inf)
+            header.flush()
+            del header
+        self._map()
+        if self.fields != fields:
+            raise ValueError(f"{path} holds {self.fields} fields, expected {fields}")
+
+    def _map(self):
+        header = np.memmap(self.path, HEADER, "r", 0, (1,))[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{self.path} is not a segment file")
+        self.compacted = bool(header["compacted"])
+        mode = "r" if self.compacted else "r+"
+        self.header = np.memmap(self.path, HEADER, mode, 0, (1,))
+        self.fields = int(header["fields"])
+        self.capacity = int(header["capacity"])
+        times, sensors, dominant, values, _ = _layout(self.capacity, self.fields)
+        self.times = np.memmap(self.path, np.float64, mode, times, (self.capacity,))
+        self.sensors = np.memmap(self.path, np.uint32, mode, sensors, (self.capacity,))
+        self.dominant = np.memmap(self.path, np.int8, mode, dominant, (self.capacity,))
+        self.values = np.memmap(self.path, np.float32, mode, values, (self.fields, self.capacity))
+
+    @property
+    def count(self) -> int:
+        return int(self.header[0]["count"])
+
+    @property
+    def start(self) -> float:
+        return float(self.header[0]["start"])
+
+    @property
+    def min_time(self) -> float:
+        return float(self.header[0]["min_time"])
+
+    @property
+    def max_time(self) -> float:
+        return float(self.header[0]["max_time"])
+
+    def overlaps(self, since: Optional[float], until: Optional[float]) -> bool:
+        return self.count > 0 and (since is None or self.max_time >= since) and (until is None or self.min_time <= until)
+
+    def recover(self) -> int:
+        """Drop trailing rows whose write never completed; returns how many were dropped"""
+        count = self.count
+        valid = count
+        while valid and self.times[valid - 1] == 0:
+            valid -= 1
+        if valid != count:
+            self.header[0]["count"] = valid
+        return count - valid
+
+    def room(self) -> int:
+        return self.capacity - self.count
+
+    def append(self, sensors: np.ndarray, times: np.ndarray, values: np.ndarray, dominant: np.ndarray):
+        """Write rows (values as (rows, fields)), then publish them by bumping the count"""
+        lo = self.count
+        hi = lo + len(times)
+        self.times[lo:hi] = times
+        self.sensors[lo:hi] = sensors
+        self.dominant[lo:hi] = dominant
+        self.values[:, lo:hi] = values.T
+        header = self.header[0]
+        header["min_time"] = min(float(header["min_time"]), float(times.min()))
+        header["max_time"] = max(float(header["max_time"]), float(times.max()))
+        header["count"] = hi
+
+    def flush(self):
+        if not self.compacted:
+            for array in (self.times, self.sensors, self.dominant, self.values, self.header):
+                array.flush()
+
+    def rows(self, sensor: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(sensors, times, values (fields, n), dominant) of one sensor or all; views when compacted"""
+        count = self.count
+        if sensor is None:
+            return self.sensors[:count], self.times[:count], self.values[:, :count], self.dominant[:count]
+        if self.compacted:
+            lo, hi = np.searchsorted(self.sensors[:count], [sensor, sensor + 1])
+            return self.sensors[lo:hi], self.times[lo:hi], self.values[:, lo:hi], self.dominant[lo:hi]
+        index = np.flatnonzero(self.sensors[:count] == sensor)
+        return self.sensors[index], self.times[index], self.values[:, index], self.dominant[index]
+
+    def compact(self) -> "Segment":
+        """Rewrite sorted by (sensor, time) at exact size; atomically replaces the file"""
+        count = self.count
+        order = np.lexsort((self.times[:count], self.sensors[:count]))
+        tmp = self.path + ".tmp"
+        compacted = Segment(tmp, self.fields, capacity=count, start=self.start)
+        if count:
+            compacted.append(self.sensors[:count][order], self.times[:count][order],
+                             self.values[:, :count][:, order].T, self.dominant[:count][order])
+        compacted.header[0]["compacted"] = 1
+        compacted.flush()
+        del compacted
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        return Segment(self.path, self.fields)
+
+class SegmentStore:
+    """Append-only, memory-mapped local history for the last SEGMENT_RETENTION_DAYS.
+
+    Every recorded reading is appended to the active segment, which rotates
+    after SEGMENT_SPAN seconds of readings or when full. `maintain` flushes
+    the active segment, compacts sealed ones and deletes expired ones.
+    Sensor ids map to uint32 indexes kept in sensors.json, written before
+    any row that uses them. Opening the store recovers after a crash:
+    leftover compaction temp files are removed, trailing rows that were
+    never counted are dropped, and existing segments are sealed so writes
+    always start a fresh one. A lock file keeps other processes on the same
+    directory from opening it for writing.
+
+    The store only holds what it was given since its first append, kept in
+    coverage.json; `covered_since` is the time from which reads can rely on
+    it, whatever old timestamps backfilled rows carry.
+    """
+
+    def __init__(self, directory: str = SEGMENT_DIR, fields: Sequence[str] = FIELDS,
+                 span: float = SEGMENT_SPAN, capacity: int = SEGMENT_CAPACITY,
+                 retention_days: float = SEGMENT_RETENTION_DAYS):
+        self.directory = directory
+        self.fields = tuple(fields)
+        self.span = span
+        self.capacity = capacity
+        self.retention = retention_days * 86400
+        self.segments: List[Segment] = []
+        self.active: Optional[Segment] = None
+        self.sensor_index: Dict[str, int] = {}
+        self.sensor_ids: List[str] = []
+        self._next_seq = 0
+        self._covered_from: Optional[float] = None
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._recovered_rows = 0
+        self._compactions = 0
+        self._expired = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._lock_file is not None
+
+    def open(self, resume_coverage: bool = True):
+        """Lock the directory, recover and map every segment.
+
+        With resume_coverage=False readings recorded while the store was
+        closed may be missing, so coverage restarts at the next append.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, "LOCK"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"Segment store {self.directory} is in use by another process")
+
+        with self._lock:
+            self._lock_file = lock_file
+            path = os.path.join(self.directory, "sensors.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.sensor_ids = json.load(f)
+                self.sensor_index = {sensor_id: i for i, sensor_id in enumerate(self.sensor_ids)}
+            path = os.path.join(self.directory, "coverage.json")
+            if resume_coverage and os.path.exists(path):
+                with open(path) as f:
+                    self._covered_from = json.load(f)["since"]
+            elif os.path.exists(path):
+                os.remove(path)
+
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(self.directory, name))
+                    continue
+                match = SEGMENT_NAME.match(name)
+                if not match:
+                    continue
+                segment = Segment(os.path.join(self.directory, name), len(self.fields))
+                if not segment.compacted:
+                    self._recovered_rows += segment.recover()
+                self.segments.append(segment)
+                self._next_seq = max(self._next_seq, int(match.group(1)) + 1)
+        logger.info(f"Segment store {self.directory}: {len(self.segments)} segments, "
+                    f"{sum(s.count for s in self.segments)} rows, {self._recovered_rows} torn rows dropped")
+
+    def close(self):
+        with self._lock:
+            if self.active is not None:
+                self.active.flush()
+            self.active = None
+            self.segments = []
+            self._covered_from = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _save_json(self, name: str, value):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(value, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _indexes(self, sensor_ids: Sequence[str]) -> np.ndarray:
+        new = [sensor_id for sensor_id in dict.fromkeys(sensor_ids) if sensor_id not in self.sensor_index]
+        if new:
+            for sensor_id in new:
+                self.sensor_index[sensor_id] = len(self.sensor_ids)
+                self.sensor_ids.append(sensor_id)
+            self._save_json("sensors.json", self.sensor_ids)
+        return np.fromiter((self.sensor_index[s] for s in sensor_ids), dtype=np.uint32, count=len(sensor_ids))
+
+    def _rotate(self, start: float) -> Segment:
+        if self.active is not None:
+            self.active.flush()
+        path = os.path.join(self.directory, f"{self._next_seq:010d}.seg")
+        self._next_seq += 1
+        self.active = Segment(path, len(self.fields), capacity=self.capacity, start=start)
+        self.segments.append(self.active)
+        return self.active
+
+    def append(self, sensor_ids: Sequence[str], times: np.ndarray, values: np.ndarray, dominant: np.ndarray):
+        """Append rows given as epoch seconds, (rows, fields) values and dominant pollutant indexes"""
+        if not self.is_open or not len(sensor_ids):
+            return
+        with self._lock:
+            if self._covered_from is None:
+                self._covered_from = time.time()
+                self._save_json("coverage.json", {"since": self._covered_from})
+            sensors = self._indexes(sensor_ids)
+            done = 0
+            while done < len(sensors):
+                active = self.active
+                if active is None or active.room() == 0 or times[done] >= active.start + self.span:
+                    active = self._rotate(float(times[done] // self.span * self.span))
+                n = min(active.room(), len(sensors) - done)
+                active.append(sensors[done:done + n], times[done:done + n], values[done:done + n],
+                              dominant[done:done + n])
+                done += n
+
+    def oldest(self) -> Optional[float]:
+        """Epoch seconds of the oldest row held, backfilled ones included"""
+        times = [segment.min_time for segment in self.segments if segment.count]
+        return min(times) if times else None
+
+    def covered_since(self, now: Optional[float] = None) -> Optional[float]:
+        """Epoch seconds from which the store holds every reading recorded, None before its first append"""
+        if self._covered_from is None:
+            return None
+        now = time.time() if now is None else now
+        return max(self._covered_from, now - self.retention)
+
+    def window(self, sensor_id: str, since: Optional[float] = None, until: Optional[float] = None) -> Window:
+        """One sensor's points in time order; zero-copy if they sit in one compacted segment"""
+        parts = []
+        index = self.sensor_index.get(sensor_id)
+        if index is not None:
+            for segment in list(self.segments):
+                if not segment.overlaps(since, until):
+                    continue
+                _, times, values, _ = segment.rows(index)
+                if segment.compacted:
+                    lo = np.searchsorted(times, since, "left") if since is not None else 0
+                    hi = np.searchsorted(times, until, "right") if until is not None else len(times)
+                    times, values = times[lo:hi], values[:, lo:hi]
+                else:
+                    keep = np.ones(len(times), dtype=bool)
+                    if since is not None:
+                        keep &= times >= since
+                    if until is not None:
+                        keep &= times <= until
+                    times, values = times[keep], values[:, keep]
+                if len(times):
+                    parts.append((times, values))
+        if not parts:
+            return np.zeros(0, dtype=np.float64), np.zeros((len(self.fields), 0), dtype=np.float32)
+        if len(parts) == 1:
+            return parts[0]
+        times = np.concatenate([t for t, _ in parts])
+        values = np.concatenate([v for _, v in parts], axis=1)
+        order = np.argsort(times, kind="stable")
+        return times[order], values[:, order]
+
+    def sensor_windows(self, since: Optional[float] = None, limit: Optional[int] = None) -> Dict[str, Window]:
+        """Every sensor's points since `since` in time order, the newest `limit` of them"""
+        parts: Dict[int, list] = {}
+        for segment in list(self.segments):
+            if not segment.overlaps(since, None):
+                continue
+            sensors, times, values, _ = segment.rows()
+            if since is not None:
+                keep = np.flatnonzero(times >= since)
+                sensors, times, values = sensors[keep], times[keep], values[:, keep]
+            if not segment.compacted:
+                order = np.argsort(sensors, kind="stable")
+                sensors, times, values = sensors[order], times[order], values[:, order]
+            present = np.unique(sensors)
+            bounds = np.searchsorted(sensors, np.append(present, present[-1] + 1) if len(present) else present)
+            for i, sensor in enumerate(present.tolist()):
+                lo, hi = bounds[i], bounds[i + 1]
+                parts.setdefault(sensor, []).append((times[lo:hi], values[:, lo:hi]))
+
+        windows = {}
+        for sensor, pieces in parts.items():
+            times = np.concatenate([t for t, _ in pieces])
+            values = np.concatenate([v for _, v in pieces], axis=1)
+            order = np.argsort(times, kind="stable")
+            if limit is not None:
+                order = order[-limit:]
+            windows[self.sensor_ids[sensor]] = (times[order], values[:, order])
+        return windows
+
+    def scan(self, since: Optional[float] = None, until: Optional[float] = None,
+             sensor_ids: Optional[Sequence[str]] = None) -> Iterator[Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]]:
+        """Rows with since <= time < until in (time, sensor id) order, one span of time per chunk.
+
+        Yields (sensor ids, times, values (fields, n), dominant).
+        """
+        with self._lock:
+            segments = [segment for segment in self.segments if segment.overlaps(since, until)]
+            known = list(self.sensor_ids)
+        if not segments:
+            return
+        wanted = None
+        if sensor_ids is not None:
+            index = {sensor_id: i for i, sensor_id in enumerate(known)}
+            wanted = np.array([index[s] for s in sensor_ids if s in index], dtype=np.uint32)
+        rank = np.argsort(np.argsort(np.array(known, dtype=object)))  # sensor index -> id sort position
+
+        lo = min(s.min_time for s in segments)
+        hi = max(s.max_time for s in segments) + 1
+        if since is not None:
+            lo = max(lo, since)
+        if until is not None:
+            hi = min(hi, until)
+        chunk_start = lo
+        while chunk_start < hi:
+            chunk_end = min(hi, (chunk_start // self.span + 1) * self.span)
+            pieces = []
+            for segment in segments:
+                if not segment.overlaps(chunk_start, chunk_end):
+                    continue
+                sensors, times, values, dominant = segment.rows()
+                # Sensors first seen after the snapshot have no rank; their rows belong to a later scan
+                keep = (times >= chunk_start) & (times < chunk_end) & (sensors < len(known))
+                if wanted is not None:
+                    keep &= np.isin(sensors, wanted)
+                index = np.flatnonzero(keep)
+                if len(index):
+                    pieces.append((sensors[index], times[index], values[:, index], dominant[index]))
+            chunk_start = chunk_end
+            if not pieces:
+                continue
+            sensors = np.concatenate([p[0] for p in pieces])
+            times = np.concatenate([p[1] for p in pieces])
+            values = np.concatenate([p[2] for p in pieces], axis=1)
+            dominant = np.concatenate([p[3] for p in pieces])
+            order = np.lexsort((rank[sensors], times))
+            yield ([known[i] for i in sensors[order].tolist()], times[order], values[:, order],
+                   dominant[order])
+
+    def rollups(self, seconds: int, since: float, sensor_ids: Sequence[str],
+                fields: Sequence[str]) -> Dict[str, List[dict]]:
+        """min/max/avg/count per field per UTC-aligned bucket, shaped like database.format_rollups"""
+        columns = [self.fields.index(f) for f in fields]
+        first = since - since % seconds
+        positions = {sensor_id: i for i, sensor_id in enumerate(sensor_ids)}
+        per_key: List[Tuple[np.ndarray, np.ndarray]] = []
+        for sensor_list, times, values, _ in self.scan(first, None, sensor_ids):
+            sensor_pos = np.fromiter((positions[s] for s in sensor_list), dtype=np.int64, count=len(sensor_list))
+            buckets = (times // seconds).astype(np.int64)
+            per_key.append((sensor_pos * (1 << 40) + buckets, values[columns].astype(np.float64)))
+
+        result: Dict[str, List[dict]] = {sensor_id: [] for sensor_id in sensor_ids}
+        if not per_key:
+            return result
+        keys = np.concatenate([k for k, _ in per_key])
+        values = np.concatenate([v for _, v in per_key], axis=1)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        stats = []
+        for row in values:
+            valid = ~np.isnan(row)
+            groups, v = inverse[valid], row[valid]
+            count = np.bincount(groups, minlength=len(unique))
+            total = np.bincount(groups, weights=v, minlength=len(unique))
+            low = np.full(len(unique), np.inf)
+            high = np.full(len(unique), -np.inf)
+            np.minimum.at(low, groups, v)
+            np.maximum.at(high, groups, v)
+            stats.append((count.tolist(), total.tolist(), low.tolist(), high.tolist()))
+
+        for k, key in enumerate(unique.tolist()):
+            sensor_pos, bucket = divmod(key, 1 << 40)
+            point = {"bucket": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(bucket * seconds))}
+            for field, (count, total, low, high) in zip(fields, stats):
+                if count[k]:
+                    point[field] = {
+                        "min": round(low[k], 4),
+                        "max": round(high[k], 4),
+                        "avg": round(total[k] / count[k], 4),
+                        "count": count[k],
+                    }
+            result[sensor_ids[sensor_pos]].append(point)
+        return result
+
+    def maintain(self, now: Optional[float] = None):
+        """Flush the active segment, compact sealed ones and delete those past retention"""
+        if not self.is_open:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            flushing = active = self.active
+            if active is not None and now >= active.start + 2 * self.span:
+                self.active = active = None  # idle: seal it so it can be compacted
+            sealed = [s for s in self.segments if s is not active and not s.compacted and s.count]
+        if flushing is not None:
+            flushing.flush()  # msync outside the lock, so appends on the event loop never wait for disk
+
+        for segment in sealed:
+            compacted = segment.compact()
+            with self._lock:
+                self.segments = [compacted if s is segment else s for s in self.segments]
+            self._compactions += 1
+
+        with self._lock:
+            expired = [s for s in self.segments if s is not self.active
+                       and (not s.count or s.max_time < now - self.retention)]
+            self.segments = [s for s in self.segments if s not in expired]
+        for segment in expired:
+            os.remove(segment.path)
+            self._expired += 1
+
+    def stats(self) -> Dict[str, object]:
+        segments = list(self.segments)
+        oldest = self.oldest()
+        return {
+            "open": self.is_open,
+            "directory": self.directory,
+            "segments": len(segments),
+            "compacted_segments": sum(1 for s in segments if s.compacted),
+            "rows": sum(s.count for s in segments),
+            "bytes": sum(os.path.getsize(s.path) for s in segments if os.path.exists(s.path)),
+            "sensors": len(self.sensor_ids),
+            "oldest": oldest,
+            "covered_since": self.covered_since(),
+            "recovered_rows": self._recovered_rows,
+            "compactions": self._compactions,
+            "expired_segments": self._expired,
+        }
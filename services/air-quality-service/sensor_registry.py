@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import math
+import os
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SENSOR_RELOAD_INTERVAL = float(os.getenv("SENSOR_RELOAD_INTERVAL", "30"))
+SENSOR_GRID_CELL_DEGREES = float(os.getenv("SENSOR_GRID_CELL_DEGREES", "0.01"))  # roughly 1 km
+
+logger = logging.getLogger(__name__)
+
+class _Index:
+    """Immutable set of lookup structures built from one load of the sensors table"""
+
+    def __init__(self, sensors: List[Dict[str, Any]], cell_size: float):
+        self.sensors = sensors
+        self.ids = [s["id"] for s in sensors]
+        self.by_id = {s["id"]: s for s in sensors}
+        self.by_district: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for sensor in sensors:
+            self.by_district[sensor["location"]].append(sensor)
+
+        self.cell_size = cell_size
+        self.lat = np.array([s["coordinates"][0] for s in sensors], dtype=np.float64)
+        self.lon = np.array([s["coordinates"][1] for s in sensors], dtype=np.float64)
+        self.grid: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for i, (lat, lon) in enumerate(zip(self.lat.tolist(), self.lon.tolist())):
+            self.grid[self.cell(lat, lon)].append(i)
+
+    def cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+class SensorRegistry:
+    """In-memory sensor registry with id, district and grid-based spatial indexes.
+
+    Indexes are rebuilt off to the side and swapped in whole, so readers never
+    see a half-built registry. `watch` polls a cheap fingerprint of the sensors
+    table and reloads only when it changes.
+    """
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]],
+                 fingerprint: Optional[Callable[[], Any]] = None,
+                 cell_size: float = SENSOR_GRID_CELL_DEGREES):
+        self.loader = loader
+        self.fingerprint = fingerprint
+        self.cell_size = cell_size
+        self.version = 0
+        self._fingerprint = None
+        self._index = _Index([], cell_size)
+
+    def __len__(self) -> int:
+        return len(self._index.sensors)
+
+    def __contains__(self, sensor_id: str) -> bool:
+        return sensor_id in self._index.by_id
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._index.sensors)
+
+    def load(self):
+        """Reload all sensors and swap in fresh indexes"""
+        fingerprint = self.fingerprint() if self.fingerprint else None
+        self.replace(self.loader())
+        self._fingerprint = fingerprint
+
+    def replace(self, sensors: List[Dict[str, Any]]):
+        self._index = _Index(list(sensors), self.cell_size)
+        self.version += 1
+        logger.info(f"Sensor registry loaded {len(sensors)} sensors (version {self.version})")
+
+    def get(self, sensor_id: str) -> Optional[Dict[str, Any]]:
+        return self._index.by_id.get(sensor_id)
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self._index.sensors
+
+    def ids(self) -> List[str]:
+        return self._index.ids
+
+    def by_district(self, district: str) -> List[Dict[str, Any]]:
+        return self._index.by_district.get(district, [])
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Dict[str, Any]]:
+        """Sensors inside the bounding box, using the grid or a vectorized scan"""
+        index = self._index
+        lo_cell = index.cell(min_lat, min_lon)
+        hi_cell = index.cell(max_lat, max_lon)
+        cells = (hi_cell[0] - lo_cell[0] + 1) * (hi_cell[1] - lo_cell[1] + 1)
+
+        if cells > len(index.grid):
+            mask = (index.lat >= min_lat) & (index.lat <= max_lat) & (index.lon >= min_lon) & (index.lon <= max_lon)
+            candidates = np.flatnonzero(mask).tolist()
+        else:
+            candidates = []
+            for x in range(lo_cell[0], hi_cell[0] + 1):
+                for y in range(lo_cell[1], hi_cell[1] + 1):
+                    for i in index.grid.get((x, y), ()):
+                        if min_lat <= index.lat[i] <= max_lat and min_lon <= index.lon[i] <= max_lon:
+                            candidates.append(i)
+            candidates.sort()
+        return [index.sensors[i] for i in candidates]
+
+    def reload_if_changed(self) -> bool:
+        if self.fingerprint is None:
+            self.load()
+            return True
+        fingerprint = self.fingerprint()
+        if fingerprint == self._fingerprint:
+            return False
+        self.replace(self.loader())
+        self._fingerprint = fingerprint
+        return True
+
+    async def watch(self, interval: float = SENSOR_RELOAD_INTERVAL):
+        """Poll for sensor table changes and hot-reload the registry"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception as e:
+                logger.error(f"Sensor registry reload failed: {e}")
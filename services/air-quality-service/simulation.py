@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from readings import ReadingBatch
+
+SIMULATED_FIELDS = ("pm25", "pm10", "o3", "no2", "co", "so2", "temperature", "humidity", "pressure")
+SIMULATED_BASE = np.array([15.0, 25.0, 80.0, 35.0, 1.2, 12.0, 22.0, 65.0, 1013.25])
+SIMULATED_POLLUTANT = np.array([True] * 6 + [False] * 3)  # weather does not follow the traffic multiplier
+simulation_rng = np.random.default_rng()
+
+def traffic_multiplier(hour: int) -> float:
+    """Pollutant level relative to daytime: higher in rush hours, lower at night"""
+    if 7 <= hour <= 9 or 17 <= hour <= 19:  # Rush hours
+        return 1.3
+    if 22 <= hour or hour <= 6:  # Night time
+        return 0.7
+    return 1.0
+
+def simulate_values(count: int, now: datetime, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """(count, len(SIMULATED_FIELDS)) readings for the local time of day of `now`"""
+    rng = simulation_rng if rng is None else rng
+    variation = rng.uniform(0.8, 1.2, size=(count, 1))
+    scale = np.where(SIMULATED_POLLUTANT, traffic_multiplier(now.hour), 1.0)
+    return np.round(SIMULATED_BASE * scale * variation, 2)
+
+def simulate_readings(sensor_ids: List[str], now: datetime) -> ReadingBatch:
+    """Simulated pollutant and weather readings, varying with time of day"""
+    return ReadingBatch.from_columns(sensor_ids, now.timestamp(), SIMULATED_FIELDS,
+                                     simulate_values(len(sensor_ids), now))
+
+def simulate_steps(count: int, times: Sequence[float], seed: int) -> np.ndarray:
+    """(len(times), count, fields) readings of `count` sensors at each epoch second in `times`.
+
+    Module-level and seeded so it can run in a process pool: each chunk of
+    sensors gets its own seed and only this module is imported by the workers.
+    """
+    rng = np.random.default_rng(seed)
+    return np.stack([simulate_values(count, datetime.fromtimestamp(t), rng) for t in times])
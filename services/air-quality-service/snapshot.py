@@ -0,0 +1,84 @@
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+class Snapshot:
+    """Pre-serialized readings from one ingestion tick"""
+
+    __slots__ = ("version", "etag", "body", "sensors", "readings")
+
+    def __init__(self, version: int, etag: str, body: bytes, sensors: Dict[str, bytes],
+                 readings: List[Dict[str, Any]]):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.sensors = sensors
+        self.readings = readings
+
+class SnapshotStore:
+    """Holds the latest reading of every sensor, serialized once and versioned.
+
+    Every reading is encoded to JSON exactly once, when it is staged; the
+    all-sensors body is the per-sensor bodies joined into an array. Readings
+    staged between ticks (pushed through /ingest or simulated) become visible
+    together on `commit`, so readers see one consistent version per tick. ETags
+    combine a per-process boot id with the version so they never repeat across
+    restarts.
+    """
+
+    def __init__(self):
+        self._boot = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._version = 0
+        self._sensors: Dict[str, bytes] = {}
+        self._readings: Dict[str, Dict[str, Any]] = {}
+        self._pending_sensors: Dict[str, bytes] = {}
+        self._pending_readings: Dict[str, Dict[str, Any]] = {}
+        self._current = Snapshot(0, self._etag(0), b"[]", {}, [])
+
+    def _etag(self, version: int) -> str:
+        return f'"{self._boot}-{version}"'
+
+    @property
+    def current(self) -> Snapshot:
+        return self._current
+
+    def stage(self, readings: List[Dict[str, Any]]):
+        """Serialize readings (dicts shaped like AirQualityData) for the next commit; later ones win"""
+        sensors = {reading["id"]: orjson.dumps(reading) for reading in readings}
+        with self._lock:
+            self._pending_sensors.update(sensors)
+            self._pending_readings.update((reading["id"], reading) for reading in readings)
+
+    def commit(self) -> Optional[Snapshot]:
+        """Merge staged readings into a new current snapshot; None if nothing was staged"""
+        with self._lock:
+            if not self._pending_sensors:
+                return None
+            self._sensors.update(self._pending_sensors)
+            self._readings.update(self._pending_readings)
+            self._pending_sensors = {}
+            self._pending_readings = {}
+            self._version += 1
+            version = self._version
+            sensors = dict(self._sensors)
+            readings = list(self._readings.values())
+        snapshot = Snapshot(
+            version,
+            self._etag(version),
+            b"[" + b",".join(sensors.values()) + b"]",
+            sensors,
+            readings,
+        )
+        self._current = snapshot
+        return snapshot
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
@@ -0,0 +1,176 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", "10"))  # seconds per attempt
+STARTUP_MAX_ATTEMPTS = int(os.getenv("STARTUP_MAX_ATTEMPTS", "0"))  # 0 retries until the step succeeds
+STARTUP_MAX_BACKOFF = float(os.getenv("STARTUP_MAX_BACKOFF", "30"))
+# Dependencies the service can run without; they are retried but do not gate readiness
+STARTUP_OPTIONAL = {name.strip() for name in os.getenv("STARTUP_OPTIONAL", "redis,rabbitmq").split(",") if name.strip()}
+
+logger = logging.getLogger(__name__)
+
+StepFn = Callable[[], Union[None, Awaitable[None]]]
+
+class Step:
+    """One named startup action and its progress"""
+
+    __slots__ = ("name", "fn", "requires", "required", "timeout", "state", "attempts", "error",
+                 "started", "finished", "done", "call")
+
+    def __init__(self, name: str, fn: StepFn, requires: Iterable[str], required: bool, timeout: float):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+        self.required = required
+        self.timeout = timeout
+        self.state = "pending"
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.done = asyncio.Event()
+        self.call: Optional[asyncio.Future] = None  # the worker thread running a sync step
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "attempts": self.attempts,
+            "seconds": round(self.finished - self.started, 4) if self.finished and self.started else None,
+            "error": self.error,
+        }
+
+class StartupOrchestrator:
+    """Connects to backends and initializes them concurrently, off the import path.
+
+    Each step runs as soon as the steps it requires are ready: sync functions
+    in a worker thread, coroutines on the loop. Every attempt is bounded by the
+    step's timeout and failures are retried with exponential backoff. A thread
+    cannot be cancelled, so after a sync step times out its retries wait for
+    the call still running rather than start another one. The
+    service is ready once every required step has succeeded; optional steps
+    keep retrying in the background and are reported as degraded.
+    """
+
+    def __init__(self, import_started: Optional[float] = None, max_attempts: int = STARTUP_MAX_ATTEMPTS,
+                 max_backoff: float = STARTUP_MAX_BACKOFF, optional: Iterable[str] = STARTUP_OPTIONAL):
+        self.import_started = import_started if import_started is not None else time.perf_counter()
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.optional = set(optional)
+        self.steps: Dict[str, Step] = {}
+        self.ready_at: Optional[float] = None
+        self._ready = asyncio.Event()
+        self._running: Optional[asyncio.Task] = None
+
+    def add(self, name: str, fn: StepFn, requires: Iterable[str] = (), required: Optional[bool] = None,
+            timeout: float = STARTUP_TIMEOUT):
+        """Register a startup step; it is required unless listed in STARTUP_OPTIONAL"""
+        is_required = name not in self.optional if required is None else required
+        self.steps[name] = Step(name, fn, requires, is_required, timeout)
+
+    def step(self, name: str, requires: Iterable[str] = (), required: Optional[bool] = None,
+             timeout: float = STARTUP_TIMEOUT):
+        """Decorator form of `add`"""
+        def decorator(fn: StepFn) -> StepFn:
+            self.add(name, fn, requires, required, timeout)
+            return fn
+        return decorator
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    @property
+    def import_to_ready_seconds(self) -> Optional[float]:
+        return round(self.ready_at - self.import_started, 4) if self.ready_at else None
+
+    async def run(self) -> bool:
+        """Run every step; returns once all have settled (True if the required ones succeeded)"""
+        if self._running is None:
+            self._running = asyncio.ensure_future(self._run())
+        return await asyncio.shield(self._running)
+
+    async def wait_ready(self):
+        """Start the steps if needed and wait until the required ones succeed"""
+        if self._running is None:
+            self._running = asyncio.ensure_future(self._run())
+        if not self.ready:
+            await self._ready.wait()
+
+    async def _run(self) -> bool:
+        unknown = {r for step in self.steps.values() for r in step.requires if r not in self.steps}
+        if unknown:
+            raise ValueError(f"Unknown startup steps required: {', '.join(sorted(unknown))}")
+
+        required = [step for step in self.steps.values() if step.required]
+        watcher = asyncio.ensure_future(self._watch_ready(required))
+        await asyncio.gather(*(self._run_step(step) for step in self.steps.values()))
+        await watcher
+        return all(step.state == "ready" for step in required)
+
+    async def _watch_ready(self, required: List[Step]):
+        await asyncio.gather(*(step.done.wait() for step in required))
+        if all(step.state == "ready" for step in required):
+            self.ready_at = time.perf_counter()
+            self._ready.set()
+            logger.info(f"Service ready {self.import_to_ready_seconds:.3f}s after import")
+        else:
+            failed = [step.name for step in required if step.state != "ready"]
+            logger.error(f"Service not ready: startup failed for {', '.join(failed)}")
+
+    async def _run_step(self, step: Step):
+        for name in step.requires:
+            prerequisite = self.steps[name]
+            await prerequisite.done.wait()
+            if prerequisite.state != "ready":
+                step.state = "blocked"
+                step.error = f"{name} failed"
+                step.done.set()
+                return
+
+        step.started = time.perf_counter()
+        backoff = 0.0
+        while True:
+            step.attempts += 1
+            step.state = "connecting" if step.attempts == 1 else "retrying"
+            try:
+                if inspect.iscoroutinefunction(step.fn):
+                    await asyncio.wait_for(step.fn(), step.timeout)
+                else:
+                    if step.call is None:
+                        step.call = asyncio.ensure_future(asyncio.to_thread(step.fn))
+                    await asyncio.wait_for(asyncio.shield(step.call), step.timeout)
+            except Exception as e:
+                if step.call is not None and step.call.done():
+                    step.call = None  # its outcome is in; the next attempt calls the step again
+                step.error = (f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)[:200]
+                if self.max_attempts and step.attempts >= self.max_attempts:
+                    step.state = "failed"
+                    step.finished = time.perf_counter()
+                    logger.error(f"Startup step {step.name} failed after {step.attempts} attempts: {step.error}")
+                    step.done.set()
+                    return
+                backoff = min(self.max_backoff, backoff * 2 if backoff else 0.5)
+                logger.warning(f"Startup step {step.name} attempt {step.attempts} failed ({step.error}), "
+                               f"retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                continue
+
+            step.state = "ready"
+            step.error = None
+            step.finished = time.perf_counter()
+            logger.info(f"Startup step {step.name} ready in {step.finished - step.started:.3f}s")
+            step.done.set()
+            return
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "import_to_ready_seconds": self.import_to_ready_seconds,
+            "dependencies": {name: step.describe() for name, step in self.steps.items()},
+        }
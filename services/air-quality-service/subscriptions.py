@@ -0,0 +1,127 @@
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import orjson
+
+WS_KEYFRAME_INTERVAL = int(os.getenv("WS_KEYFRAME_INTERVAL", "12"))  # one minute of 5 second ticks
+
+class Subscription:
+    """What a client asked to receive: a set of sensors and a set of fields"""
+
+    __slots__ = ("sensors", "fields", "key")
+
+    def __init__(self, sensors: FrozenSet[str], fields: Optional[Tuple[str, ...]]):
+        self.sensors = sensors
+        self.fields = fields
+        self.key = (sensors, fields)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"sensors": sorted(self.sensors), "fields": list(self.fields) if self.fields else None}
+
+def parse_subscription(message: Dict[str, Any], registry, known_fields: Iterable[str]) -> Subscription:
+    """Resolve a subscribe message against the sensor registry; raises ValueError"""
+    if message.get("sensors") is not None:
+        selected = set(message["sensors"])
+        unknown = {sensor_id for sensor_id in selected if sensor_id not in registry}
+        if unknown:
+            raise ValueError(f"Unknown sensors: {', '.join(sorted(unknown))}")
+    else:
+        selected = set(registry.ids())
+
+    bbox = message.get("bbox")
+    if bbox is not None:
+        values = [float(v) for v in bbox] if len(bbox) == 4 else []
+        if (len(values) != 4 or not all(math.isfinite(v) for v in values)
+                or values[0] > values[2] or values[1] > values[3]):
+            raise ValueError("bbox must be [min_lat, min_lon, max_lat, max_lon]")
+        selected &= {s["id"] for s in registry.in_bbox(*values)}
+
+    fields = message.get("fields")
+    if fields is not None:
+        unknown = set(fields) - set(known_fields)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields = tuple(sorted(set(fields)))
+
+    return Subscription(frozenset(selected), fields)
+
+class DeltaEncoder:
+    """Builds keyframe and delta frames for subscribed clients.
+
+    A keyframe carries the full selected state; a delta carries only fields
+    that changed since the previous tick and applies on top of everything the
+    client received before it. Ticks with no changes send nothing. Changes are
+    detected once per tick, and each distinct subscription's frame is
+    serialized at most once per tick however many clients share it.
+    """
+
+    def __init__(self, keyframe_interval: int = WS_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.timestamp = ""
+        self._readings: Dict[str, Dict[str, Any]] = {}
+        self._previous: Dict[str, Dict[str, float]] = {}
+        self._changed: Dict[str, Dict[str, float]] = {}
+        self._frames: Dict[tuple, Optional[str]] = {}
+
+    @property
+    def forced_keyframe(self) -> bool:
+        return self.keyframe_interval > 0 and self.seq % self.keyframe_interval == 0
+
+    def begin_tick(self, readings: List[Dict[str, Any]]):
+        """Register this tick's readings (dicts shaped like AirQualityData)"""
+        self.seq += 1
+        self.timestamp = datetime.now().isoformat()
+        self._frames = {}
+        self._changed = {}
+        for reading in readings:
+            sensor_id = reading["id"]
+            data = reading["data"]
+            previous = self._previous.get(sensor_id, {})
+            changed = {k: v for k, v in data.items() if previous.get(k) != v}
+            if changed:
+                self._changed[sensor_id] = changed
+            self._previous[sensor_id] = data
+            self._readings[sensor_id] = reading
+
+    def frame(self, subscription: Subscription, keyframe: bool) -> Optional[str]:
+        """Serialized frame for a subscription, or None for an empty delta"""
+        cache_key = (subscription.key, keyframe)
+        if cache_key not in self._frames:
+            self._frames[cache_key] = self._build(subscription, keyframe)
+        return self._frames[cache_key]
+
+    def _build(self, subscription: Subscription, keyframe: bool) -> Optional[str]:
+        fields = subscription.fields
+        items = []
+        for sensor_id in sorted(subscription.sensors):
+            if keyframe:
+                reading = self._readings.get(sensor_id)
+                if reading is None:
+                    continue
+                data = reading["data"]
+                if fields:
+                    data = {k: data[k] for k in fields if k in data}
+                items.append({**reading, "data": data})
+            else:
+                changed = self._changed.get(sensor_id)
+                if not changed:
+                    continue
+                if fields:
+                    changed = {k: changed[k] for k in fields if k in changed}
+                    if not changed:
+                        continue
+                items.append({"id": sensor_id, "timestamp": self._readings[sensor_id]["timestamp"], "data": changed})
+
+        if not keyframe and not items:
+            return None
+
+        message = {
+            "type": "air_quality_keyframe" if keyframe else "air_quality_delta",
+            "seq": self.seq,
+            "data": items,
+            "timestamp": self.timestamp,
+        }
+        return orjson.dumps(message).decode()
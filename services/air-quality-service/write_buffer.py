@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class PartialFlush(Exception):
+    """Raised by a flush function when only some items failed; just those are retried"""
+
+    def __init__(self, retry: List[Any], message: str):
+        super().__init__(message)
+        self.retry = retry
+
+class WriteBehindBuffer:
+    """Collects items in memory and hands them to `flush_fn` in batches.
+
+    A background thread flushes whenever `batch_size` items are pending or the
+    oldest pending item is older than `flush_interval` seconds. A failed batch
+    is put back at the front and retried with backoff, or only the items named
+    by a PartialFlush. The buffer holds
+    at most `max_pending` items; `add` blocks for up to `block_timeout` seconds
+    when it is full and rejects the item if no room frees up in time.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Any]], None],
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_pending: int = 50000,
+        block_timeout: float = 0.05,
+        name: str = "write-behind",
+    ):
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.name = name
+
+        self._pending: deque = deque()
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._added = 0
+        self._flushed = 0
+        self._rejected = 0
+        self._errors = 0
+        self._flushes = 0
+        self._flush_seconds_total = 0.0
+        self._flush_seconds_max = 0.0
+        self._last_flush_seconds = 0.0
+        self._last_flush_size = 0
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def add(self, item: Any) -> bool:
+        """Queue one item; returns False if the buffer stayed full"""
+        return self.add_many([item]) == 1
+
+    def add_many(self, items: List[Any]) -> int:
+        """Queue several items and return how many were accepted"""
+        accepted = 0
+        deadline = time.monotonic() + self.block_timeout
+        with self._cond:
+            for item in items:
+                while len(self._pending) >= self.max_pending and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.notify_all()
+                    self._cond.wait(timeout=remaining)
+                if len(self._pending) >= self.max_pending:
+                    self._rejected += len(items) - accepted
+                    break
+                if not self._pending:
+                    self._oldest = time.monotonic()
+                self._pending.append(item)
+                accepted += 1
+
+            self._added += accepted
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return accepted
+
+    def flush(self):
+        """Synchronously flush everything that is pending"""
+        while True:
+            batch = self._take(self.max_pending)
+            if not batch:
+                return
+            self._flush_batch(batch)
+
+    def close(self, timeout: float = 10.0):
+        """Stop the flush thread after draining pending items"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._pending)
+            oldest = self._oldest
+        return {
+            "queue_depth": depth,
+            "max_pending": self.max_pending,
+            "oldest_pending_seconds": round(time.monotonic() - oldest, 3) if depth and oldest else 0.0,
+            "added": self._added,
+            "flushed": self._flushed,
+            "rejected": self._rejected,
+            "errors": self._errors,
+            "flushes": self._flushes,
+            "last_flush_size": self._last_flush_size,
+            "last_flush_seconds": round(self._last_flush_seconds, 6),
+            "avg_flush_seconds": round(self._flush_seconds_total / self._flushes, 6) if self._flushes else 0.0,
+            "max_flush_seconds": round(self._flush_seconds_max, 6),
+        }
+
+    def _take(self, limit: int) -> List[Any]:
+        with self._cond:
+            batch = []
+            while self._pending and len(batch) < limit:
+                batch.append(self._pending.popleft())
+            self._oldest = time.monotonic() if self._pending else None
+            self._cond.notify_all()
+            return batch
+
+    def _requeue(self, batch: List[Any]):
+        with self._cond:
+            room = self.max_pending - len(self._pending)
+            keep = batch[:max(room, 0)]
+            self._rejected += len(batch) - len(keep)
+            self._pending.extendleft(reversed(keep))
+            if self._pending and self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _flush_batch(self, batch: List[Any]) -> List[Any]:
+        """Flush one batch; returns the items to retry"""
+        started = time.perf_counter()
+        retry: List[Any] = []
+        try:
+            self.flush_fn(batch)
+        except PartialFlush as e:
+            self._errors += 1
+            logger.error(f"{self.name}: failed to flush {len(e.retry)} of {len(batch)} items: {e}")
+            retry = e.retry
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"{self.name}: failed to flush {len(batch)} items: {e}")
+            return batch
+
+        elapsed = time.perf_counter() - started
+        self._flushes += 1
+        self._flushed += len(batch) - len(retry)
+        self._last_flush_size = len(batch) - len(retry)
+        self._last_flush_seconds = elapsed
+        self._flush_seconds_total += elapsed
+        self._flush_seconds_max = max(self._flush_seconds_max, elapsed)
+        return retry
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        wait = self._oldest + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = self.flush_interval
+                    self._cond.wait(timeout=wait)
+                if self._stopping:
+                    return
+
+            batch = self._take(self.batch_size)
+            if not batch:
+                continue
+            retry = self._flush_batch(batch)
+            if not retry:
+                backoff = 0.0
+                continue
+
+            self._requeue(retry)
+            backoff = min(30.0, backoff * 2 if backoff else 0.5)
+            with self._cond:
+                if not self._stopping:
+                    self._cond.wait(timeout=backoff)
@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from subscriptions import DeltaEncoder, Subscription
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "8"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "evict")  # evict | drop_oldest
+
+logger = logging.getLogger(__name__)
+
+_client_ids = itertools.count(1)
+
+class ClientConnection:
+    """One WebSocket client with its own bounded send queue and sender task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.id = next(_client_ids)
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.connected_at = time.time()
+        self.closed = False
+        self.subscription: Optional[Subscription] = None
+        self.last_seq = 0
+        self.needs_keyframe = True
+
+        self.sent = 0
+        self.dropped = 0
+        self.last_send_seconds = 0.0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        client = self.websocket.client
+        return {
+            "id": self.id,
+            "peer": f"{client.host}:{client.port}" if client else None,
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+            "subscription": self.subscription.describe() if self.subscription else None,
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "last_send_seconds": round(self.last_send_seconds, 6),
+            "last_lag_seconds": round(self.last_lag_seconds, 6),
+            "max_lag_seconds": round(self.max_lag_seconds, 6),
+        }
+
+class ConnectionManager:
+    """Fans pre-serialized frames out to WebSocket clients concurrently.
+
+    `broadcast_tick` never awaits a socket: it drops the frame into every client's
+    bounded queue and a per-client task does the sending, so one slow client
+    cannot hold back the others. A client whose queue is full is evicted, or
+    loses its oldest queued frame under the drop_oldest policy.
+    """
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT,
+                 overflow_policy: str = WS_OVERFLOW_POLICY):
+        if overflow_policy not in ("evict", "drop_oldest"):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.overflow_policy = overflow_policy
+        self.clients: Dict[int, ClientConnection] = {}
+
+        self._broadcasts = 0
+        self._evicted = 0
+        self._dropped = 0
+        self._send_errors = 0
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection(websocket, self.queue_size)
+        client.task = asyncio.create_task(self._sender(client))
+        self.clients[client.id] = client
+        return client
+
+    def disconnect(self, client: ClientConnection):
+        if client.closed:
+            return
+        client.closed = True
+        self.clients.pop(client.id, None)
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def broadcast_tick(self, full_frame: bytes, encoder: DeltaEncoder) -> int:
+        """Queue this tick for every client: the shared full frame (JSON bytes, decoded
+        once and only if a client takes it) for clients without a subscription, a
+        keyframe or delta for subscribed ones"""
+        self._broadcasts += 1
+        enqueued_at = time.perf_counter()
+        reached = 0
+        full_payload: Optional[str] = None
+        for client in list(self.clients.values()):
+            subscription = client.subscription
+            if subscription is None:
+                if full_payload is None:
+                    full_payload = full_frame.decode()
+                payload = full_payload
+            else:
+                keyframe = client.needs_keyframe or client.last_seq != encoder.seq - 1 or encoder.forced_keyframe
+                if not keyframe and client.queue.full() and self.overflow_policy == "drop_oldest":
+                    # Dropping a queued delta would break the chain; replace the backlog with a keyframe
+                    self._discard_queue(client)
+                    keyframe = True
+                payload = encoder.frame(subscription, keyframe)
+                if payload is None:
+                    client.last_seq = encoder.seq
+                    continue
+                if not self.enqueue(client, payload, enqueued_at):
+                    continue
+                client.last_seq = encoder.seq
+                client.needs_keyframe = False
+                reached += 1
+                continue
+
+            if self.enqueue(client, payload, enqueued_at):
+                reached += 1
+        return reached
+
+    def subscribe(self, client: ClientConnection, subscription: Optional[Subscription]):
+        client.subscription = subscription
+        client.needs_keyframe = True
+
+    def _discard_queue(self, client: ClientConnection):
+        while not client.queue.empty():
+            client.queue.get_nowait()
+            client.dropped += 1
+            self._dropped += 1
+
+    def enqueue(self, client: ClientConnection, payload: str, enqueued_at: Optional[float] = None) -> bool:
+        item = (payload, enqueued_at or time.perf_counter())
+        try:
+            client.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        client.dropped += 1
+        self._dropped += 1
+        if self.overflow_policy == "drop_oldest":
+            client.queue.get_nowait()
+            client.queue.put_nowait(item)
+            return True
+
+        self._evict(client)
+        return False
+
+    def _evict(self, client: ClientConnection):
+        self._evicted += 1
+        logger.warning(f"Evicting slow WebSocket client {client.id} ({client.queue.qsize()} frames queued)")
+        self.disconnect(client)
+        asyncio.create_task(self._close(client.websocket, code=1013))
+
+    async def _close(self, websocket: WebSocket, code: int = 1000):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _sender(self, client: ClientConnection):
+        try:
+            while True:
+                payload, enqueued_at = await client.queue.get()
+                started = time.perf_counter()
+                await asyncio.wait_for(client.websocket.send_text(payload), self.send_timeout)
+                finished = time.perf_counter()
+                client.sent += 1
+                client.last_send_seconds = finished - started
+                client.last_lag_seconds = finished - enqueued_at
+                client.max_lag_seconds = max(client.max_lag_seconds, client.last_lag_seconds)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._send_errors += 1
+            logger.info(f"WebSocket client {client.id} send failed: {e!r}")
+            self.disconnect(client)
+            await self._close(client.websocket)
+
+    def stats(self, limit: int = 100) -> Dict[str, Any]:
+        """Aggregate fan-out counters plus the `limit` most lagged connections"""
+        clients = list(self.clients.values())
+        lags = [c.last_lag_seconds for c in clients]
+        slowest: List[ClientConnection] = sorted(clients, key=lambda c: c.last_lag_seconds, reverse=True)[:limit]
+        return {
+            "connections": len(clients),
+            "queue_size": self.queue_size,
+            "overflow_policy": self.overflow_policy,
+            "broadcasts": self._broadcasts,
+            "evicted": self._evicted,
+            "dropped_frames": self._dropped,
+            "send_errors": self._send_errors,
+            "queued_frames": sum(c.queue.qsize() for c in clients),
+            "max_lag_seconds": round(max(lags), 6) if lags else 0.0,
+            "avg_lag_seconds": round(sum(lags) / len(lags), 6) if lags else 0.0,
+            "clients": [c.stats() for c in slowest],
+        }